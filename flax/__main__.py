@@ -1,3 +1,90 @@
-from flax.ui.console import main
+import argparse
+import sys
 
-main()
+
+parser = argparse.ArgumentParser(prog='flax', description="A roguelike.")
+parser.add_argument(
+    '--startup-profile', action='store_true',
+    help="time each phase of startup, print a report, and exit")
+parser.add_argument(
+    '--seed', type=int,
+    help="seed for the world; the same seed always makes the same dungeon")
+parser.add_argument(
+    '--record', metavar='FILE',
+    help="record a journal of the game to FILE, for replaying later")
+parser.add_argument(
+    '--replay', metavar='FILE',
+    help="replay a recorded journal headlessly, check it, and exit")
+subparsers = parser.add_subparsers(dest='command')
+
+sim_parser = subparsers.add_parser(
+    'sim', help="play a game headlessly and report how fast it ran",
+    description="Build a world and play it with no terminal, then report "
+    "generation time, turns per second, and events fired.")
+sim_parser.add_argument(
+    '--turns', type=int, default=1000,
+    help="how many turns to run (default: %(default)s)")
+sim_parser.add_argument(
+    '--seed', type=int,
+    help="seed for the world")
+sim_parser.add_argument(
+    '--script', metavar='FILE',
+    help="play out the steps in FILE (direction names, descend, ascend, "
+    "pickup; whitespace-separated) instead of wandering at random")
+sim_parser.add_argument(
+    '--record', metavar='FILE',
+    help="record a journal of the simulated game to FILE")
+sim_parser.add_argument(
+    '--start', metavar='MAP',
+    help="start on the named map (e.g. map2) instead of the first floor")
+sim_parser.add_argument(
+    '--pregenerate', action='store_true',
+    help="generate upcoming floors in the background, as the game does")
+sim_parser.add_argument(
+    '--profile', action='store_true',
+    help="profile events and rules, and print the slowest")
+
+args = parser.parse_args()
+
+if args.command == 'sim':
+    from flax.sim import Simulation, report, scripted_policy
+    policy = None
+    if args.script:
+        with open(args.script) as f:
+            policy = scripted_policy(f.read().split())
+    sim = Simulation(
+        seed=args.seed, policy=policy, pregenerate=args.pregenerate,
+        start=args.start)
+    if args.record:
+        from flax.journal import JournalWriter
+        sim.world.journal = JournalWriter.open(args.record, sim.world.seed)
+    if args.profile:
+        from flax.event import start_profiling, stop_profiling
+        start_profiling()
+    try:
+        result = sim.run(args.turns)
+    finally:
+        if args.profile:
+            profiler = stop_profiling()
+        sim.world.close()
+    report(result)
+    if args.profile:
+        print()
+        print(profiler.table(limit=20))
+elif args.startup_profile:
+    from flax.startup import profile_startup
+    profile_startup().report()
+elif args.replay:
+    from flax.journal import JournalMismatch, replay
+    try:
+        result = replay(args.replay)
+    except JournalMismatch as e:
+        print(e)
+        sys.exit(1)
+    print("replayed {} turns and {} actions in {:.3f}s ({:.0f} turns/s); "
+          "all checksums match".format(
+              result.turns, result.actions, result.elapsed,
+              result.turns / result.elapsed if result.elapsed else 0))
+else:
+    from flax.ui.console import main
+    main(seed=args.seed, record=args.record)
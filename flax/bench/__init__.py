@@ -0,0 +1,3 @@
+"""Benchmarks.  Not part of the game proper; each module here can be run with
+``python -m flax.bench.<name>`` and prints a little report.
+"""
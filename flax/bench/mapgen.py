@@ -0,0 +1,59 @@
+"""Measures map generation throughput, serially and across processes.
+
+Run with:
+
+    python -m flax.bench.mapgen --count 200 --workers 4
+
+Generates `count` maps, cycling through the same fractors the game uses, once
+in this process and once spread across a pool of worker processes, and
+reports maps per second for each.
+"""
+import argparse
+import os
+import time
+
+from flax.entity import EntityRegistry
+from flax.fractor import MapSpec
+from flax.fractor import PerlinFractor
+from flax.fractor import RuinFractor
+from flax.fractor import RuinedHallFractor
+from flax.fractor import generate_many
+from flax.geometry import Size
+
+
+SPECS = [
+    MapSpec(RuinFractor, Size(120, 30), down='down'),
+    MapSpec(RuinedHallFractor, Size(120, 30), up='up', down='down'),
+    MapSpec(PerlinFractor, Size(150, 40), up='up', down='down'),
+    MapSpec(PerlinFractor, Size(60, 30), up='up'),
+]
+
+
+def run(count, workers, seed):
+    specs = [SPECS[n % len(SPECS)] for n in range(count)]
+    seeds = ['{}/{}'.format(seed, n) for n in range(count)]
+    started = time.perf_counter()
+    generate_many(specs, seeds, workers=workers, registry=EntityRegistry())
+    return time.perf_counter() - started
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--count', type=int, default=100,
+        help="maps to generate")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(),
+        help="worker processes for the parallel run (default: one per core)")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    print("{:<24} {:>10} {:>10}".format("run", "seconds", "maps/s"))
+    for name, workers in (
+            ("serial", 1),
+            ("{} workers".format(args.workers), args.workers)):
+        seconds = run(args.count, workers, args.seed)
+        print("{:<24} {:>10.2f} {:>10.1f}".format(
+            name, seconds, args.count / seconds))
+
+
+if __name__ == '__main__':
+    main()
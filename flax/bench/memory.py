@@ -0,0 +1,90 @@
+"""Measures how much memory entities and generated maps hold onto.
+
+Run with:
+
+    python -m flax.bench.memory
+
+For a handful of entity types, reports the bytes retained per entity.  Then
+for each `Fractor`, generates a map and reports the memory the finished map
+retains, along with the number of entities on it.
+"""
+import argparse
+import gc
+import random
+import tracemalloc
+
+from flax.entity import CaveWall, Floor, Player, Salamango, Potion
+from flax.fractor import BinaryPartitionFractor
+from flax.fractor import PerlinFractor
+from flax.fractor import RuinFractor
+from flax.fractor import RuinedHallFractor
+from flax.geometry import Size
+
+
+ENTITY_TYPES = [Floor, CaveWall, Potion, Salamango, Player]
+
+FRACTORS = [
+    ('RuinFractor', lambda rng: RuinFractor(Size(120, 30), rng=rng)),
+    ('RuinedHallFractor', lambda rng: RuinedHallFractor(Size(120, 30), rng=rng)),
+    ('PerlinFractor', lambda rng: PerlinFractor(Size(150, 40), rng=rng)),
+    ('BinaryPartitionFractor', lambda rng: BinaryPartitionFractor(
+        Size(80, 24), minimum_size=Size(10, 8), rng=rng)),
+]
+
+
+def measure(build):
+    """Call `build` and return ``(result, bytes)``, where ``bytes`` is how
+    much memory is still allocated once `build` has returned.
+    """
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        result = build()
+        gc.collect()
+        after = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    return result, after - before
+
+
+def bytes_per_entity(entity_type, count):
+    entities, size = measure(
+        lambda: [entity_type() for _ in range(count)])
+    # Don't charge the entities for the list holding them
+    _, list_size = measure(lambda: [None] * count)
+    return (size - list_size) / count
+
+
+def map_memory(make_fractor, seed):
+    fractor = make_fractor(random.Random(seed))
+    map, size = measure(lambda: fractor.generate_map(up='up', down='down'))
+    entities = sum(1 for tile in map.tiles.values() for _ in tile.entities)
+    return size, entities, len(map.tiles)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--count', type=int, default=10000,
+        help="entities to create when measuring per-entity size")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    print("Per-entity memory ({} of each)".format(args.count))
+    print("{:<24} {:>12}".format("type", "bytes/entity"))
+    for entity_type in ENTITY_TYPES:
+        print("{:<24} {:>12.1f}".format(
+            entity_type.name, bytes_per_entity(entity_type, args.count)))
+
+    print()
+    print("Map memory (seed {})".format(args.seed))
+    print("{:<24} {:>8} {:>10} {:>12} {:>12}".format(
+        "fractor", "tiles", "entities", "total KiB", "bytes/tile"))
+    for name, make_fractor in FRACTORS:
+        size, entities, tiles = map_memory(make_fractor, args.seed)
+        print("{:<24} {:>8} {:>10} {:>12.1f} {:>12.1f}".format(
+            name, tiles, entities, size / 1024, size / tiles))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""Change notifications, for anything that wants to react when an entity's
+data changes -- mostly the UI, which would otherwise have to redraw
+everything after every turn just in case.
+
+Each `EntityRegistry` has a `ChangeFeed`.  Component attribute writes publish
+``(entity, attribute)``, where the attribute is the zope `Attribute` (e.g.
+``ICombatant['current_health']``).  Relations coming or going publish
+``(entity, relation class)`` for both ends.
+
+Nothing is published at all while nobody's subscribed.
+"""
+
+
+class Subscription:
+    __slots__ = ('callback', 'entity_id', 'attributes')
+
+    def __init__(self, callback, entity_id, attributes):
+        self.callback = callback
+        self.entity_id = entity_id
+        self.attributes = attributes
+
+    def matches(self, attribute):
+        return self.attributes is None or attribute in self.attributes
+
+
+class ChangeFeed:
+    """Hands out change notifications to subscribers.  See the module
+    docstring.
+    """
+    def __init__(self):
+        # Entity id => list of subscriptions for that entity
+        self._by_entity = {}
+        # Subscriptions for every entity
+        self._everything = []
+
+    def __bool__(self):
+        return bool(self._by_entity or self._everything)
+
+    def subscribe(self, callback, entity=None, attributes=None):
+        """Call ``callback(entity, attribute)`` whenever something changes.
+        If `entity` is given, only changes to that entity are reported; if
+        `attributes` is given, only changes to those attributes or relation
+        types are.  Returns a `Subscription`, for `unsubscribe`.
+        """
+        if attributes is not None:
+            attributes = frozenset(attributes)
+
+        if entity is None:
+            subscription = Subscription(callback, None, attributes)
+            self._everything.append(subscription)
+        else:
+            subscription = Subscription(callback, entity.id, attributes)
+            self._by_entity.setdefault(entity.id, []).append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        if subscription.entity_id is None:
+            self._everything.remove(subscription)
+        else:
+            subscriptions = self._by_entity[subscription.entity_id]
+            subscriptions.remove(subscription)
+            if not subscriptions:
+                del self._by_entity[subscription.entity_id]
+
+    def publish(self, entity, attribute):
+        for subscription in self._by_entity.get(entity.id, ()):
+            if subscription.matches(attribute):
+                subscription.callback(entity, attribute)
+        for subscription in self._everything:
+            if subscription.matches(attribute):
+                subscription.callback(entity, attribute)
+
+    def relation_changed(self, relation, attached):
+        """Listener for a `RelationStore`."""
+        if not self:
+            return
+
+        predicate = type(relation)
+        for entity in (relation.from_entity, relation.to_entity):
+            if entity is not None:
+                self.publish(entity, predicate)
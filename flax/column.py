@@ -0,0 +1,175 @@
+"""Columnar storage for hot component attributes.
+
+Normally an entity's component data lives in its own little dict, keyed by
+zope `Attribute`.  That's fine for poking at one entity, but a system that
+wants to look at, say, the health of every combatant on the map ends up doing
+a dict lookup per entity per attribute.
+
+An interface can instead declare an attribute with ``column=typecode``:
+
+    class ICombatant(IComponent):
+        current_health = static_attribute("...", column='l')
+
+While an entity is placed on a map, its values for such attributes live in a
+per-map `ColumnStore`: one typed `array` per attribute, indexed by a row number
+the store hands out.  Entity reads and writes go through the store
+transparently, so components never know the difference.  When the entity
+leaves the map, its values are copied back into its own dict -- but only the
+ones it had there to begin with, or that were written while it was on the
+map; anything else was just the type's default, and stays that way.
+
+Systems can then walk whole columns at once:
+
+    for entity in map.columns.select(
+            lambda cur, max: cur < max * 0.25,
+            ICombatant['current_health'], ICombatant['maximum_health']):
+        ...
+
+Note that the store holds base values; modifiers (from equipment and the like)
+are only applied when reading through a component.
+"""
+from array import array
+
+
+class Column:
+    """A single columnar attribute: the values, plus a flag per row saying
+    whether that row actually has a value, and another saying whether the
+    value belongs to the entity (rather than being a copy of its type's
+    default).
+    """
+    __slots__ = ('typecode', 'values', 'present', 'owned')
+
+    def __init__(self, typecode, rows):
+        self.typecode = typecode
+        self.values = array(typecode, bytes(array(typecode).itemsize * rows))
+        self.present = bytearray(rows)
+        self.owned = bytearray(rows)
+
+    def grow(self):
+        self.values.append(0)
+        self.present.append(0)
+        self.owned.append(0)
+
+
+class ColumnStore:
+    """Per-map storage for every columnar attribute of every entity on the
+    map.  See the module docstring.
+    """
+    def __init__(self):
+        self.columns = {}
+        # Row number => entity, or None for a free row
+        self.entities = []
+        self.free_rows = []
+
+    def __len__(self):
+        return len(self.entities) - len(self.free_rows)
+
+    def _allocate_row(self):
+        if self.free_rows:
+            return self.free_rows.pop()
+
+        row = len(self.entities)
+        self.entities.append(None)
+        for column in self.columns.values():
+            column.grow()
+        return row
+
+    def _column(self, attribute, typecode):
+        column = self.columns.get(attribute)
+        if column is None:
+            column = Column(typecode, len(self.entities))
+            self.columns[attribute] = column
+        return column
+
+    def bind(self, entity):
+        """Move the entity's columnar attributes into this store.  Does
+        nothing if its type has no columnar attributes.
+        """
+        attributes = entity.type.column_attributes
+        if not attributes:
+            return
+        assert entity._columns is None, "entity is already in a column store"
+
+        row = self._allocate_row()
+        self.entities[row] = entity
+        data = entity._component_data
+        for attribute, typecode in attributes:
+            column = self._column(attribute, typecode)
+            try:
+                value = entity[attribute]
+            except KeyError:
+                column.present[row] = 0
+                column.owned[row] = 0
+                continue
+
+            column.values[row] = value
+            column.present[row] = 1
+            if data is not None and attribute in data:
+                column.owned[row] = 1
+                del data[attribute]
+            else:
+                column.owned[row] = 0
+
+        entity._columns = self
+        entity._row = row
+
+    def unbind(self, entity):
+        """Copy the entity's own columnar attributes back into the entity,
+        and free up its row.  Values that were only ever the type's defaults
+        aren't copied, so the entity keeps following its type.
+        """
+        if entity._columns is None:
+            return
+        assert entity._columns is self
+
+        row = entity._row
+        entity._columns = None
+        entity._row = None
+        for attribute, _ in entity.type.column_attributes:
+            column = self.columns[attribute]
+            if column.present[row] and column.owned[row]:
+                entity[attribute] = column.values[row]
+            column.present[row] = 0
+            column.owned[row] = 0
+
+        self.entities[row] = None
+        self.free_rows.append(row)
+
+    def get(self, attribute, row):
+        column = self.columns[attribute]
+        if not column.present[row]:
+            raise KeyError(attribute)
+        return column.values[row]
+
+    def set(self, attribute, row, value):
+        column = self.columns[attribute]
+        column.values[row] = value
+        column.present[row] = 1
+        column.owned[row] = 1
+
+    def iter_rows(self, *attributes):
+        """Yield a tuple of ``(entity, value, ...)`` for every entity in the
+        store that has all of the given attributes.
+        """
+        try:
+            columns = [self.columns[attribute] for attribute in attributes]
+        except KeyError:
+            # Nobody on this map has one of these attributes
+            return
+
+        n = len(columns)
+        for entity, *fields in zip(
+                self.entities,
+                *(column.values for column in columns),
+                *(column.present for column in columns)):
+            if entity is None or not all(fields[n:]):
+                continue
+            yield (entity, *fields[:n])
+
+    def select(self, predicate, *attributes):
+        """Yield every entity whose values for the given attributes satisfy
+        ``predicate(*values)``.
+        """
+        for entity, *values in self.iter_rows(*attributes):
+            if predicate(*values):
+                yield entity
@@ -16,14 +16,16 @@ import zope.interface as zi
 
 from flax.event import PickUp
 from flax.event import MeleeAttack, Damage, Die
-from flax.event import Ascend, Descend, Walk
+from flax.event import Ascend, Descend, Teleport, Walk
 from flax.event import Open, Unlock
 from flax.event import Equip
 from flax.event import Unequip
 
 from flax.relation import RelationSubject
 from flax.relation import RelationObject
+from flax.relation import Contains
 from flax.relation import Wearing
+from flax.timing import NORMAL_SPEED
 
 
 log = logging.getLogger(__name__)
@@ -45,9 +47,15 @@ class GameOver(Exception):
 # TODO distinguish between those that should only be altered with modifiers
 # (like stats), and those that are expected to change (like /current/ health
 # and inventory)?
-def static_attribute(doc):
+def static_attribute(doc, *, column=None):
+    """Declare an attribute stored on the entity.  If `column` is given, it's
+    an `array` typecode, and the attribute will be kept in the map's
+    `ColumnStore` while the entity is on a map.
+    """
     attr = zi.Attribute(doc)
     attr.setTaggedValue('mode', 'static')
+    if column is not None:
+        attr.setTaggedValue('column', column)
     return attr
 
 
@@ -59,6 +67,52 @@ def derived_attribute(doc):
     return attr
 
 
+# Walking an interface's attributes through zope is surprisingly slow, and
+# every component class for the same interface would otherwise do it again
+_attribute_cache = {}
+
+
+def interface_attributes(interface):
+    """Return a tuple of ``(name, attribute)`` for every `zi.Attribute` in the
+    given interface, including inherited ones.  Cached.
+    """
+    try:
+        return _attribute_cache[interface]
+    except KeyError:
+        pass
+
+    pairs = []
+    for key in interface:
+        attr = interface[key]
+        if isinstance(attr, zi.Attribute):
+            pairs.append((key, attr))
+
+    ret = _attribute_cache[interface] = tuple(pairs)
+    return ret
+
+
+_column_attributes_cache = {}
+
+
+def column_attributes(interface):
+    """Return a tuple of ``(attribute, typecode)`` for every columnar
+    attribute in the given interface.
+    """
+    try:
+        return _column_attributes_cache[interface]
+    except KeyError:
+        pass
+
+    pairs = []
+    for key, attr in interface_attributes(interface):
+        typecode = attr.queryTaggedValue('column')
+        if typecode is not None:
+            pairs.append((attr, typecode))
+
+    ret = _column_attributes_cache[interface] = tuple(pairs)
+    return ret
+
+
 class IComponentFactory(zi.Interface):
     """An object that produces components.  Usually these are component
     classes, but sometimes they're wrapped in a `ComponentInitializer`.
@@ -131,11 +185,7 @@ class ComponentMeta(type):
         # Slap on an attribute descriptor for every static attribute in the
         # interface.  (Derived attributes promise that they're computed by the
         # class via @property or some other mechanism.)
-        for key in interface:
-            attr = interface[key]
-            if not isinstance(attr, zi.Attribute):
-                continue
-
+        for key, attr in interface_attributes(interface):
             mode = attr.queryTaggedValue('mode')
             if mode == 'static':
                 if key in cls.__dict__:
@@ -206,20 +256,37 @@ class ComponentAttribute:
         except KeyError:
             raise AttributeError
 
-        # TODO this doesn't seem right really.  i think modifiers should really
-        # be tracked separately, and removed by the relation destructor
-        for relation_set in self.entity.relates_to.values():
-            for relation in relation_set:
-                # TODO lol yeah this definitely won't work
-                for mod in IEquipment(relation.to_entity).modifiers:
-                    value = mod.modify(attr, value)
+        registry = self.entity.registry
+        if registry is not None:
+            modifiers = registry.relations.derived(
+                self.entity, 'modifiers', _collect_modifiers)
+            for mod in modifiers:
+                value = mod.modify(attr, value)
 
         return value
 
     def __set__(desc, self, value):
         # TODO seems like this doesn't make sense for something subject to
         # modifiers?
-        self.entity.component_data[desc.zope_attribute] = value
+        entity = self.entity
+        entity[desc.zope_attribute] = value
+
+        registry = entity.registry
+        if registry is not None and registry.changes:
+            registry.changes.publish(entity, desc.zope_attribute)
+
+
+def _collect_modifiers(relations, entity):
+    # TODO this doesn't seem right really.  i think modifiers should really
+    # be tracked separately, and removed by the relation destructor
+    # Only what's actually worn counts; carrying armor around in a backpack
+    # doesn't do anything for you
+    modifiers = []
+    for relation in relations.objects(entity, Wearing).values():
+        other = relation.to_entity
+        if other is not None and IEquipment in other:
+            modifiers.extend(IEquipment(other).modifiers)
+    return tuple(modifiers)
 
 
 class IComponent(zi.Interface):
@@ -500,11 +567,10 @@ def do_unlock(event, lockable):
     # touchability rules for all this...)
     lockable.locked = False
 
-    # Destroy the key.  TODO: need to be able to tell an entity that i'm taking
-    # it away from whatever owns it, whatever that may mean!  inform's "now"
-    # does this
-    IContainer(event.actor).inventory.remove(event.agent)
-
+    # Destroy the key.  Destroying it takes it out of the actor's inventory,
+    # too.  TODO: need to be able to tell an entity that i'm taking it away
+    # from whatever owns it, whatever that may mean!  inform's "now" does this
+    event.world.destroy_entity(event.agent)
 
 
 @Open.check(Lockable)
@@ -518,14 +584,20 @@ def cant_open_locked_things(event, lockable):
 # Containment
 
 class IContainer(IComponent):
-    inventory = static_attribute("Items contained by this container.")
+    inventory = derived_attribute("Items directly contained by this container.")
+
+    def has(predicate):
+        """Whether this container holds something matching `predicate`, at
+        any depth.  See `ContainmentGraph.contains_transitively`.
+        """
 
 
 class Container(Component, interface=IContainer):
-    # TODO surely this isn't called when something is polymorphed.  right?
-    # or...  maybe it is, if the entity didn't have an IContainer before?
-    def __init__(self):
-        self.inventory = []
+    inventory = RelationSubject(Contains)
+
+    def has(self, predicate):
+        return self.entity.registry.containment.contains_transitively(
+            self.entity, predicate)
 
 
 # -----------------------------------------------------------------------------
@@ -533,8 +605,10 @@ class Container(Component, interface=IContainer):
 
 class ICombatant(IComponent):
     """Implements an entity's ability to fight and take damage."""
-    maximum_health = static_attribute("Entity's maximum possible health.")
-    current_health = static_attribute("Current amount of health.")
+    maximum_health = static_attribute(
+        "Entity's maximum possible health.", column='l')
+    current_health = static_attribute(
+        "Current amount of health.", column='l')
     strength = static_attribute("Generic placeholder stat.")
 
 
@@ -566,7 +640,7 @@ class Combatant(Component, interface=ICombatant):
 def do_melee_attack(event, combatant):
     opponent = ICombatant(event.actor)
     event.world.queue_immediate_event(
-        Damage(combatant.entity, opponent.strength))
+        Damage(combatant.entity, opponent.strength, source=event.actor))
 
 
 @MeleeAttack.announce(Combatant)
@@ -580,6 +654,21 @@ def do_damage(event, combatant):
     combatant.lose_health(event)
 
 
+@Damage.announce(Combatant)
+def announce_merged_damage(event, combatant):
+    # Single hits are already announced by whatever caused them
+    if len(event.sources) < 2:
+        return
+    log.info("{} takes {} damage ({})".format(
+        combatant.entity.type.name,
+        event.amount,
+        ", ".join(
+            "{} {}".format(
+                "something" if source is None else source.type.name, amount)
+            for source, amount in event.sources),
+    ))
+
+
 @Die.perform(Combatant)
 def do_die(event, combatant):
     # TODO player death is a little different.  should be a separate component,
@@ -589,8 +678,25 @@ def do_die(event, combatant):
     if combatant.entity.isa(Player):
         raise GameOver("you died  :(", success=False)
 
-    event.world.current_map.remove(combatant.entity)
-    # TODO and drop inventory, and/or a corpse
+    entity = combatant.entity
+    world = event.world
+    if IContainer in entity:
+        map = world.floor_plan.map_holding(entity)
+        if map is None:
+            # Nowhere to drop anything, so it all goes too
+            for item in world.entities.containment.all_contents(entity):
+                world.destroy_entity(item)
+        else:
+            # Drop everything it was carrying where it fell.  (Crates keep
+            # their own contents.)
+            position = map.find(entity).position
+            inventory = IContainer(entity).inventory
+            for item in list(inventory):
+                inventory.remove(item)
+                map.place(item, position)
+
+    world.destroy_entity(entity)
+    # TODO and/or a corpse
 
 
 @Die.announce(Combatant)
@@ -608,7 +714,9 @@ class Breakable(Component, interface=ICombatant):
         self.strength = 0
 
     def __init__(self, health_fraction):
-        self.current_health = health_fraction * self.maximum_health
+        # Health is stored as an integer column, so round
+        self.current_health = int(
+            health_fraction * self.maximum_health + 0.5)
 
 
 # -----------------------------------------------------------------------------
@@ -619,6 +727,10 @@ class IActor(IComponent):
     `IActor` component can decide to perform actions on its own, and has a
     sense of speed and time.
     """
+    speed = static_attribute(
+        """How often this entity gets to act.  100 is once a turn; 200 is
+        twice as often, 50 half as often.""")
+
     def act(world):
         """Return an action to be performed (i.e., an `Event` to be fired), or
         `None` to do nothing.
@@ -626,12 +738,19 @@ class IActor(IComponent):
         """
 
 
-class GenericAI(Component, interface=IActor):
+class Actor(Component, interface=IActor):
+    """Base class for actors; just handles speed."""
+    def __typeinit__(self, *, speed=NORMAL_SPEED):
+        if speed <= 0:
+            raise ValueError("Actors need a positive speed, not {!r}".format(speed))
+        self.speed = speed
+
+
+class GenericAI(Actor):
     def act(self, world):
         from flax.geometry import Direction
         from flax.event import Walk
         from flax.event import MeleeAttack
-        import random
         pos = world.current_map.find(self.entity).position
         player_pos = world.current_map.find(world.player).position
         for direction in Direction:
@@ -640,15 +759,20 @@ class GenericAI(Component, interface=IActor):
                 return
 
         # TODO try to walk towards player
-        world.queue_event(Walk(self.entity, random.choice(list(Direction))))
+        world.queue_event(Walk(self.entity, world.rng.choice(list(Direction))))
 
 
-class PlayerIntelligence(Component, interface=IActor):
+class PlayerIntelligence(Actor):
     def act(self, world):
         if world.player_action_queue:
             world.queue_immediate_event(world.player_action_queue.popleft())
 
 
+@Teleport.perform(PlayerIntelligence)
+def do_teleport(event, intelligence):
+    event.world.change_map(event.destination)
+
+
 # -----------------------------------------------------------------------------
 # Items
 
@@ -667,7 +791,7 @@ def do_pick_up(event, portable):
     from flax.entity import Layer
     assert portable.entity.type.layer is Layer.item
     event.world.current_map.remove(portable.entity)
-    IContainer(event.actor).inventory.append(portable.entity)
+    IContainer(event.actor).inventory.add(portable.entity)
 
 
 @PickUp.announce(Portable)
@@ -747,7 +871,7 @@ def can_only_equip_whats_equipped(event, equipment):
 
 @Unequip.perform(Equipment)
 def take_off_equipment(event, equipment):
-    self.worn_by.remove(event.actor)
+    equipment.worn_by.remove(event.actor)
 
 
 @Unequip.announce(Equipment)
@@ -1,8 +1,8 @@
-from collections import defaultdict
 from enum import Enum
 from functools import partial
 
 from flax.component import Component
+from flax.component import column_attributes
 from flax.component import Render, OpenRender
 from flax.component import ICombatant, Combatant
 from flax.component import Solid, Empty, DoorPhysics
@@ -14,6 +14,9 @@ from flax.component import Bodied
 from flax.component import Equipment
 from flax.component import GenericAI, PlayerIntelligence
 from flax.component import PortalDownstairs, PortalUpstairs
+from flax.change import ChangeFeed
+from flax.relation import ContainmentGraph
+from flax.relation import RelationStore
 
 
 class Layer(Enum):
@@ -31,6 +34,10 @@ class EntityType:
     Consists primarily of some number of components, each implementing a
     different interface.
     """
+    # Components write type-level data through the type itself, and a type
+    # never belongs to a registry
+    registry = None
+
     # TODO would be swell to require some components?  e.g. IRender, IPhysics?
     def __init__(self, *components, layer, name, tmp_rendering=None):
         self.layer = layer
@@ -51,38 +58,80 @@ class EntityType:
 
             component.init_entity_type(self)
 
+        # Every interface and component class this type satisfies, so that
+        # `x in entity` is a single set lookup.  Component classes include
+        # superclasses that implement the same interface, e.g. Physics for
+        # Solid, but not Component itself.
+        capabilities = set(self.components)
+        for iface, component in self.components.items():
+            for cls in component.__mro__:
+                if issubclass(cls, Component) and cls.interface is iface:
+                    capabilities.add(cls)
+        self.capabilities = frozenset(capabilities)
+
+        # Attributes that live in a map's ColumnStore while the entity is on
+        # the map
+        self.column_attributes = tuple(
+            pair
+            for iface in self.components
+            for pair in column_attributes(iface)
+        )
+
     def __repr__(self):
         return "<{}: {}>".format(type(self).__qualname__, self.name)
 
+    def __contains__(self, component):
+        """Returns True iff entities of this type support the given component
+        or interface.
+        """
+        return component in self.capabilities
+
     def __call__(self, *args, **kwargs):
         """Create a new entity of this type.  Implemented so you can pretend
         these are classes.
         """
         return Entity(self, *args, **kwargs)
 
-    def __getitem__(self, key):
-        return self.component_data[key]
-
-    def __setitem__(self, key, value):
-        self.component_data[key] = value
+    def create_many(self, n, initializers=()):
+        """Create `n` new entities of this type, all with the same
+        initializers.  Much faster than calling the type `n` times, since the
+        init plan is only worked out once.
+        """
+        plan = self.init_plan(initializers)
+        new = Entity.__new__
+        entities = []
+        for _ in range(n):
+            entity = new(Entity)
+            entity._init_slots(self)
+            if plan:
+                entity._run_init_plan(plan)
+            entities.append(entity)
+        return entities
+
+    def restore(self, component_data):
+        """Create an entity of this type with exactly the given component data
+        (a dict of attribute => value), skipping the initializers.  For
+        putting back together an entity that was taken apart, e.g. to send it
+        to another process.
+        """
+        entity = Entity.__new__(Entity)
+        entity._init_slots(self)
+        if component_data:
+            entity._component_data = dict(component_data)
+        return entity
 
+    _default_init_plan = None
 
-class Entity:
-    """An entity in the game world.  Might be anything from a chunk of the
-    floor to a segment of a giant worm.
-    """
-    def __init__(self, type, *initializers):
-        # TODO probably just allow kwargs when not ambiguous
-        self.type = type
-        self.component_data = {}
+    def init_plan(self, initializers=()):
+        """Work out which component initializers need to run to create an
+        entity of this type, given some initializers to use as overrides.
 
-        # TODO these don't allow two objects to be related in more than one
-        # way.  probably want to keep the triples and indexes of them
-        # separately?  maybe want a relationship-blob object
-        # TODO these names are terribly confusing and i really need a way to
-        # make english grammar help me out here
-        self.relates_to = defaultdict(set)
-        self.related_to = defaultdict(set)
+        Returns a tuple of ``(interface, initializer)`` pairs, in component
+        order.  Components without an ``__init__`` are left out entirely.  The
+        plan without any overrides is cached, since that's most entities.
+        """
+        if not initializers and self._default_init_plan is not None:
+            return self._default_init_plan
 
         # Index the initializers by interface
         initializer_map = {}
@@ -91,7 +140,7 @@ class Entity:
                 raise TypeError(
                     "Constructor for {!r} got two initializers for the same "
                     "interface {!r}: {!r} and {!r}".format(
-                        self.type,
+                        self,
                         initializer.interface,
                         initializer.component,
                         initializer_map[initializer.interface].component,
@@ -106,7 +155,8 @@ class Entity:
         # to the type, just like python's attribute lookup.  but that doesn't
         # work if everything has to go through the constructor.  or maybe i'm
         # just worrying too much about mem use.
-        for interface, component in self.type.components.items():
+        plan = []
+        for interface, component in self.components.items():
             if interface in initializer_map:
                 initializer = initializer_map.pop(interface)
                 if not issubclass(component, initializer.component):
@@ -114,7 +164,7 @@ class Entity:
                         "Constructor for {!r} got an initializer for {!r}, "
                         "which is not a superclass of the actual component "
                         "{!r}".format(
-                            self.type,
+                            self,
                             initializer.component,
                             component,
                         )
@@ -122,6 +172,72 @@ class Entity:
             else:
                 initializer = component
 
+            if initializer.component.__init__ is Component.__init__:
+                # Nothing to do, so don't bother calling it
+                continue
+            plan.append((interface, initializer))
+
+        if initializer_map:
+            # TODO run them, or ignore them?
+            pass
+
+        plan = tuple(plan)
+        if not initializers:
+            self._default_init_plan = plan
+        return plan
+
+    def __getitem__(self, key):
+        return self.component_data[key]
+
+    def __setitem__(self, key, value):
+        self.component_data[key] = value
+
+
+class Entity:
+    """An entity in the game world.  Might be anything from a chunk of the
+    floor to a segment of a giant worm.
+
+    There are a lot of these -- at least one per tile of every map -- and most
+    of them are plain old floor that never does anything interesting.  So this
+    class uses slots, and the dict for component data is only created the
+    first time something is written to it.  Relations don't live on the
+    entity at all; see `flax.relation.RelationStore`.
+    """
+    __slots__ = (
+        'type',
+        # Assigned by an EntityRegistry; None until then
+        'id',
+        'registry',
+        '_component_data',
+        # Set while the entity's columnar attributes live in a map's
+        # ColumnStore; see flax.column
+        '_columns',
+        '_row',
+        '__weakref__',
+    )
+
+    def __init__(self, type, *initializers):
+        # TODO probably just allow kwargs when not ambiguous
+        self._init_slots(type)
+        self._run_init_plan(type.init_plan(initializers))
+
+    @property
+    def released(self):
+        """True once this entity has been released from its registry, i.e.
+        destroyed.
+        """
+        return self.registry is None and self.id is not None
+
+    def _init_slots(self, type):
+        self.type = type
+        self.id = None
+        self.registry = None
+        self._component_data = None
+        self._columns = None
+        self._row = None
+
+    def _run_init_plan(self, plan):
+        for interface, initializer in plan:
             try:
                 initializer.init_entity(self)
             except Exception:
@@ -132,10 +248,6 @@ class Entity:
                     .format(self.type, interface, initializer)
                 )
 
-        if initializer_map:
-            # TODO run them, or ignore them?
-            pass
-
     def __repr__(self):
         return "<{}: {}>".format(
             type(self).__qualname__,
@@ -154,15 +266,7 @@ class Entity:
         """Returns True iff this entity supports the given component or
         interface.
         """
-        if issubclass(component, Component):
-            try:
-                my_component = self.type.components[component.interface]
-            except KeyError:
-                return False
-            else:
-                return issubclass(my_component, component)
-        else:
-            return component in self.type.components
+        return component in self.type.capabilities
 
     # TODO this isn't used any more but i'm keeping it for the TODOs
     def add_modifiers(self, *modifiers):
@@ -172,22 +276,33 @@ class Entity:
         # TODO: fire events when stats change?  (is that how the UI should be
         # updated?)
 
-    def __getitem__(self, key):
-        try:
-            return self.component_data[key]
-        except KeyError:
-            return self.type.component_data[key]
+    @property
+    def component_data(self):
+        if self._component_data is None:
+            self._component_data = {}
+        return self._component_data
 
-    def __setitem__(self, key, value):
-        self.component_data[key] = value
+    def __getitem__(self, key):
+        columns = self._columns
+        if columns is not None and key in columns.columns:
+            return columns.get(key, self._row)
 
-    def attach_relation(self, relation):
-        reltype = type(relation)
-        self.relations[reltype].add(relation)
+        data = self._component_data
+        if data is not None:
+            try:
+                return data[key]
+            except KeyError:
+                pass
+        return self.type.component_data[key]
 
-    def detach_relation(self, relation):
-        reltype = type(relation)
-        self.relations[reltype].remove(relation)
+    def __setitem__(self, key, value):
+        columns = self._columns
+        if columns is not None and key in columns.columns:
+            columns.set(key, self._row, value)
+        elif self._component_data is None:
+            self._component_data = {key: value}
+        else:
+            self._component_data[key] = value
 
     def isa(self, entity_type):
         return self.type is entity_type
@@ -202,6 +317,78 @@ class Entity:
             adapted.handle_event(event)
 
 
+class EntityRegistry:
+    """Hands out compact integer ids to entities, and maps them back again.
+    The `World` owns one of these, and every entity placed on one of its maps
+    gets registered.
+
+    Ids are never reused, so they're safe to store anywhere an entity
+    reference would otherwise go: saved games, snapshots, relation and event
+    indexes, arrays.  The registry holds strong references, so entities
+    should be released when they're destroyed.
+
+    Also owns the `RelationStore` for all the entities it knows about, the
+    `ContainmentGraph` built on top of it, and the `ChangeFeed` that reports
+    changes to any of them.
+    """
+    def __init__(self):
+        # id => entity, or None once released
+        self._entities = []
+        self._live = 0
+        self.relations = RelationStore()
+        self.containment = ContainmentGraph(self)
+        self.changes = ChangeFeed()
+        self.relations.listeners.append(self.changes.relation_changed)
+
+    def __len__(self):
+        return self._live
+
+    def __iter__(self):
+        for entity in self._entities:
+            if entity is not None:
+                yield entity
+
+    def __contains__(self, entity):
+        return entity.registry is self
+
+    def __getitem__(self, id):
+        entity = self._entities[id]
+        if entity is None:
+            raise KeyError(id)
+        return entity
+
+    def get(self, id, default=None):
+        try:
+            return self[id]
+        except (IndexError, KeyError):
+            return default
+
+    def register(self, entity):
+        """Give the entity an id, if it doesn't already have one from this
+        registry.  Returns the id.
+        """
+        if entity.id is not None:
+            assert entity in self, (
+                "{!r} already has an id from some other registry"
+                .format(entity))
+            return entity.id
+
+        entity.id = len(self._entities)
+        entity.registry = self
+        self._entities.append(entity)
+        self._live += 1
+        return entity.id
+
+    def release(self, entity):
+        """Forget about an entity, presumably because it's been destroyed.
+        Its id stays reserved forever.
+        """
+        assert entity in self
+        self._entities[entity.id] = None
+        entity.registry = None
+        self._live -= 1
+
+
 ###############################################################################
 # Sprite and color enumerations.
 # These are separate because (a) they naturally get reused a lot among similar
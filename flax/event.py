@@ -1,5 +1,9 @@
 from enum import Enum
+import json
 import logging
+import time
+
+from flax.util import WeakProperty
 
 
 log = logging.getLogger(__name__)
@@ -19,8 +23,13 @@ class Rule:
 
 
 class Rulebook:
-    def __init__(self):
+    def __init__(self, name=None):
+        # Just for profiling and debugging, e.g. "Walk.check"
+        self.name = name
         self.rules = []
+        # Entity type => tuple of (function, adapter) for every rule that
+        # applies to that type, in order.  Thrown away whenever a rule is added
+        self._compiled = {}
 
     def __call__(self, *args, **kwargs):
         def decorator(f):
@@ -31,15 +40,42 @@ class Rulebook:
 
     def add(self, rule):
         self.rules.append(rule)
+        self._compiled.clear()
 
-    def run(self, subject, target):
-        # TODO this knows a lot about events, whereas inform7 does not
-        # TODO flesh this out, be less invasive
+    def compile(self, entity_type):
+        """Return the rules that apply to entities of the given type, as a
+        tuple of ``(function, adapt)``, where ``adapt(entity)`` produces the
+        component to pass to the function.  Cached per type.
+        """
+        try:
+            return self._compiled[entity_type]
+        except KeyError:
+            pass
+
+        capabilities = entity_type.capabilities
+        table = []
         for rule in self.rules:
             # TODO better "does this rule apply?" logic
-            if rule.direct_object not in target:
+            if rule.direct_object not in capabilities:
                 continue
-            rule.function(subject, rule.direct_object.interface(target))
+            # Skip the trip through zope's adapter hooks and go straight to
+            # the component class this type actually uses
+            component = entity_type.components[rule.direct_object.interface]
+            table.append((rule.function, component.adapt))
+
+        table = self._compiled[entity_type] = tuple(table)
+        return table
+
+    def run(self, subject, target):
+        # TODO this knows a lot about events, whereas inform7 does not
+        # TODO flesh this out, be less invasive
+        table = self.compile(target.type)
+        if _profiler is not None:
+            _profiler.run_rules(self, table, subject, target)
+            return
+
+        for function, adapt in table:
+            function(subject, adapt(target))
 
 
 class CancelEvent(Exception):
@@ -49,9 +85,33 @@ class CancelEvent(Exception):
 class MetaEvent(type):
     def __init__(cls, name, bases, attrs):
         super().__init__(name, bases, attrs)
-        cls.check = Rulebook()
-        cls.perform = Rulebook()
-        cls.announce = Rulebook()
+        cls.check = Rulebook(name + '.check')
+        cls.perform = Rulebook(name + '.perform')
+        cls.announce = Rulebook(name + '.announce')
+
+
+class computed_target:
+    """Decorator for an event's `target`, when it has to be worked out from
+    the state of the map rather than given up front.  Works like a property,
+    except the result is cached until the current map changes, or until
+    someone calls `Event.retarget`.  `Event.fire` starts with a fresh cache.
+    """
+    def __init__(self, resolve):
+        self.resolve = resolve
+        self.__doc__ = resolve.__doc__
+
+    def __get__(desc, self, cls):
+        if self is None:
+            return desc
+
+        current_map = self.world.current_map
+        cached = self.__dict__.get('_resolved_target')
+        if cached is not None and cached[0] is current_map:
+            return cached[1]
+
+        target = desc.resolve(self)
+        self._resolved_target = current_map, target
+        return target
 
 
 # TODO is it worth separating "action" from "event"?  where an event is purely
@@ -66,9 +126,34 @@ class MetaEvent(type):
 # the rulebook approach
 class Event(metaclass=MetaEvent):
     cancelled = False
+    # Whether several of this event aimed at the same target can be folded
+    # into one, if the world is coalescing events; see `merge`
+    combinable = False
+    # Names of the attributes that, passed to the constructor in order, would
+    # recreate this event.  Lets the journal record it; see flax.journal
+    fields = None
+
+    # Entities taking part in the event are only held weakly, so an event
+    # sitting in a queue doesn't keep a dead creature alive.  Subclasses may
+    # compute `target` instead
+    actor = WeakProperty('actor')
+    target = WeakProperty('target')
+    agent = WeakProperty('agent')
+    # How many events deep this one was caused, i.e. 0 for an event queued by
+    # an actor, 1 for an event queued while firing that, etc.  Maintained by
+    # the world's queue
+    cascade_depth = 0
 
     def fire(self, world):
+        world.events_fired += 1
+        if _profiler is not None:
+            _profiler.fire_event(self, world)
+        else:
+            self._fire(world)
+
+    def _fire(self, world):
         self.world = world
+        self.retarget()
 
         if not self.target:
             log.debug("oops no target for {}".format(self))
@@ -97,15 +182,197 @@ class Event(metaclass=MetaEvent):
             return
 
     def cancel(self):
+        self.cancelled = True
         raise CancelEvent
 
+    def merge(self, other):
+        """Fold `other`, an event of the same type with the same target, into
+        this one.  Only called for `combinable` events.
+        """
+        raise TypeError("{} events can't be merged".format(type(self).__name__))
+
+    def retarget(self):
+        """Forget any cached `computed_target`, so the next read works it out
+        again.  For rules that move things around and then care where the
+        event is pointing.
+        """
+        self.__dict__.pop('_resolved_target', None)
+
+    def is_stale(self):
+        """Return True if any entity this event was created with has since
+        been destroyed.  Computed targets aren't evaluated.
+        """
+        data = self.__dict__
+        for name in ('actor', 'target', 'agent'):
+            ref = data.get(name)
+            if ref is None:
+                continue
+            entity = ref()
+            if entity is None or entity.released:
+                return True
+        return False
+
+
+# -----------------------------------------------------------------------------
+# Profiling
+
+class _Timing:
+    __slots__ = ('calls', 'total', 'max')
+
+    def __init__(self):
+        self.calls = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, elapsed):
+        self.calls += 1
+        self.total += elapsed
+        if elapsed > self.max:
+            self.max = elapsed
+
+    def as_dict(self):
+        return dict(calls=self.calls, total=self.total, max=self.max)
+
+
+class EventProfiler:
+    """Records how often each event fires and each rule runs, and how long
+    they take.  Opt-in, since it costs a couple of clock reads per rule; see
+    `start_profiling`.
+
+    Event times include any events fired synchronously from inside them, so
+    they overlap.  Rule times don't include the time spent adapting the
+    target, which is negligible.
+    """
+    def __init__(self):
+        # (rulebook name, rule function) => _Timing
+        self.rules = {}
+        # event class name => _Timing
+        self.events = {}
+        # event class name => deepest cascade seen
+        self.max_depths = {}
+        # Events currently firing, outermost first
+        self._stack = []
+
+    def fire_event(self, event, world):
+        # Events fired directly from inside another event's rules count as
+        # one deeper, too
+        depth = event.cascade_depth
+        if self._stack:
+            depth = max(depth, self._stack[-1] + 1)
+
+        name = type(event).__name__
+        if depth > self.max_depths.get(name, -1):
+            self.max_depths[name] = depth
+
+        self._stack.append(depth)
+        start = time.perf_counter()
+        try:
+            event._fire(world)
+        finally:
+            elapsed = time.perf_counter() - start
+            self._stack.pop()
+            timing = self.events.get(name)
+            if timing is None:
+                timing = self.events[name] = _Timing()
+            timing.record(elapsed)
+
+    def run_rules(self, rulebook, table, subject, target):
+        clock = time.perf_counter
+        for function, adapt in table:
+            component = adapt(target)
+            start = clock()
+            try:
+                function(subject, component)
+            finally:
+                elapsed = clock() - start
+                key = rulebook.name, function
+                timing = self.rules.get(key)
+                if timing is None:
+                    timing = self.rules[key] = _Timing()
+                timing.record(elapsed)
+
+    def as_dict(self):
+        return dict(
+            events={
+                name: dict(timing.as_dict(), max_depth=self.max_depths[name])
+                for name, timing in self.events.items()
+            },
+            rules=[
+                dict(
+                    timing.as_dict(),
+                    rulebook=rulebook_name,
+                    rule="{}.{}".format(
+                        function.__module__, function.__qualname__),
+                )
+                for (rulebook_name, function), timing in self.rules.items()
+            ],
+        )
+
+    def to_json(self, **kwargs):
+        return json.dumps(self.as_dict(), **kwargs)
+
+    def table(self, limit=None):
+        """Return a plain-text table of rules, slowest (by total time) first,
+        followed by events.  Times are in milliseconds.
+        """
+        data = self.as_dict()
+        lines = []
+        row = "{:>7} {:>9} {:>8}  {}"
+        lines.append(row.format("calls", "total ms", "max ms", "rule"))
+        rules = sorted(data['rules'], key=lambda r: r['total'], reverse=True)
+        for rule in rules[:limit]:
+            lines.append(row.format(
+                rule['calls'], "{:.3f}".format(rule['total'] * 1000),
+                "{:.3f}".format(rule['max'] * 1000),
+                "{} ({})".format(rule['rule'], rule['rulebook'])))
+
+        lines.append("")
+        row = "{:>7} {:>9} {:>8} {:>5}  {}"
+        lines.append(row.format("calls", "total ms", "max ms", "depth", "event"))
+        events = sorted(
+            data['events'].items(), key=lambda kv: kv[1]['total'], reverse=True)
+        for name, event in events[:limit]:
+            lines.append(row.format(
+                event['calls'], "{:.3f}".format(event['total'] * 1000),
+                "{:.3f}".format(event['max'] * 1000), event['max_depth'], name))
+        return "\n".join(lines)
+
+
+_profiler = None
+
+
+def start_profiling():
+    """Start recording into a fresh `EventProfiler`, and return it."""
+    global _profiler
+    _profiler = EventProfiler()
+    return _profiler
+
+
+def stop_profiling():
+    """Stop recording, and return the profiler, or None if profiling wasn't
+    on.
+    """
+    global _profiler
+    profiler = _profiler
+    _profiler = None
+    return profiler
+
+
+def current_profiler():
+    return _profiler
+
+
+# -----------------------------------------------------------------------------
+# Events
 
 class Walk(Event):
+    fields = ('actor', 'direction')
+
     def __init__(self, actor, direction):
         self.actor = actor
         self.direction = direction
 
-    @property
+    @computed_target
     def target(self):
         map = self.world.current_map
         new_pos = map.find(self.actor).position + self.direction
@@ -116,26 +383,44 @@ class Walk(Event):
 
 
 class Descend(Event):
+    fields = ('actor',)
+
     def __init__(self, actor):
         self.actor = actor
 
-    @property
+    @computed_target
     def target(self):
         map = self.world.current_map
         return map.find(self.actor)
 
 
 class Ascend(Event):
+    fields = ('actor',)
+
     def __init__(self, actor):
         self.actor = actor
 
-    @property
+    @computed_target
     def target(self):
         map = self.world.current_map
         return map.find(self.actor)
 
 
+class Teleport(Event):
+    """Go straight to another map, no stairs required.  Wizard mode only,
+    but it's still an event, so it gets journaled like anything else.
+    """
+    fields = ('actor', 'destination')
+
+    def __init__(self, actor, destination):
+        self.actor = actor
+        self.target = actor
+        self.destination = destination
+
+
 class Open(Event):
+    fields = ('actor', 'target')
+
     def __init__(self, actor, target):
         self.actor = actor
         self.target = target
@@ -144,6 +429,8 @@ class Open(Event):
 
 
 class Unlock(Event):
+    fields = ('actor', 'target', 'agent')
+
     def __init__(self, actor, target, agent):
         self.actor = actor
         self.target = target
@@ -153,6 +440,8 @@ class Unlock(Event):
 
 
 class PickUp(Event):
+    fields = ('actor', 'target')
+
     def __init__(self, actor, item):
         self.actor = actor
         self.target = item
@@ -161,6 +450,8 @@ class PickUp(Event):
 
 
 class Equip(Event):
+    fields = ('actor', 'target')
+
     def __init__(self, actor, item):
         self.actor = actor
         self.target = item
@@ -169,6 +460,8 @@ class Equip(Event):
 
 
 class Unequip(Event):
+    fields = ('actor', 'target')
+
     def __init__(self, actor, item):
         self.actor = actor
         self.target = item
@@ -178,6 +471,8 @@ class Unequip(Event):
 
 
 class MeleeAttack(Event):
+    fields = ('actor', 'direction')
+
     def __init__(self, actor, direction):
         # TODO a direction makes sense at a glance here since that's generally
         # how you swing e.g. a sword, but it won't work for throwing,
@@ -186,17 +481,11 @@ class MeleeAttack(Event):
         self.actor = actor
         self.direction = direction
 
-    @property
+    @computed_target
     def target(self):
+        # Note that if the attacker died first, the world won't fire this
         map = self.world.current_map
-        try:
-            new_pos = map.find(self.actor).position + self.direction
-        except KeyError:
-            # TODO uggh this is also kind of a general problem: events queued
-            # by entities who then die before they're fired.  i think i need
-            # something like a queue where each item is tied to a weakref.
-            # something similar would help with auto-discarding modifiers too
-            return None
+        new_pos = map.find(self.actor).position + self.direction
         if new_pos not in map:
             return None
         return map.tiles[new_pos].creature
@@ -204,15 +493,29 @@ class MeleeAttack(Event):
 
 class Damage(Event):
     cancelable = False
+    combinable = True
+    fields = ('target', 'amount')
 
-    def __init__(self, target, amount):
-        self.actor = None  # TODO some kind of source?
+    def __init__(self, target, amount, source=None):
+        # TODO should the source be the actor?
         self.target = target
         self.amount = amount
+        # List of (source, amount), for when several hits are merged
+        self.sources = [(source, amount)]
+
+    def merge(self, other):
+        self.amount += other.amount
+        self.sources.extend(other.sources)
 
 
 class Die(Event):
     cancelable = False
+    combinable = True
+    fields = ('target',)
 
     def __init__(self, target):
         self.target = target
+
+    def merge(self, other):
+        # Can only die once
+        pass
@@ -1,13 +1,18 @@
+from array import array
 from collections import defaultdict
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
 from functools import reduce
+from importlib import import_module
 import math
 import operator
 import random
+import time
 
 from flax.component import Breakable, IPhysics, Empty
 import flax.entity as e
 from flax.entity import (
-    Entity, CaveWall, Floor, Tree, Grass, CutGrass, Salamango, Armor,
+    Entity, EntityType, CaveWall, Floor, Tree, Grass, CutGrass, Salamango, Armor,
     Potion, StairsDown, StairsUp,
     KadathGate
 )
@@ -16,12 +21,12 @@ from flax.map import Map
 from flax.noise import discrete_perlin_noise_factory
 
 
-def random_normal_int(mu, sigma):
+def random_normal_int(mu, sigma, rng=random):
     """Return a normally-distributed random integer, given a mean and standard
     deviation.  The return value is guaranteed never to lie outside µ ± 3σ, and
     anything beyond µ ± 2σ is very unlikely (4% total).
     """
-    ret = int(random.gauss(mu, sigma) + 0.5)
+    ret = int(rng.gauss(mu, sigma) + 0.5)
 
     # We have to put a limit /somewhere/, and the roll is only outside these
     # bounds 0.3% of the time.
@@ -36,7 +41,7 @@ def random_normal_int(mu, sigma):
         return ret
 
 
-def random_normal_range(lb, ub):
+def random_normal_range(lb, ub, rng=random):
     """Return a normally-distributed random integer, given an upper bound and
     lower bound.  Like `random_normal_int`, but explicitly specifying the
     limits.  Return values will be clustered around the midpoint.
@@ -44,7 +49,7 @@ def random_normal_range(lb, ub):
     # Like above, we assume the lower and upper bounds are 6σ apart
     mu = (lb + ub) / 2
     sigma = (ub - lb) / 4
-    ret = int(random.gauss(mu, sigma) + 0.5)
+    ret = int(rng.gauss(mu, sigma) + 0.5)
 
     if ret < lb:
         return lb
@@ -103,19 +108,211 @@ class MapCanvas:
         else:
             return type_or_thing()
 
-    def to_map(self):
-        map = Map(self.rect.size)
-        maybe_create = self.maybe_create
+    def to_map(self, registry=None):
+        map = Map(self.rect.size, registry)
 
+        # Group the points by entity type first, so each type can create all
+        # its entities in one go
+        pending = defaultdict(list)
         for point in self.rect.iter_points():
-            map.place(maybe_create(self._arch_grid[point]), point)
+            pending[self._arch_grid[point]].append(point)
             for item_type in self._item_grid[point]:
-                map.place(maybe_create(item_type), point)
+                pending[item_type].append(point)
             if self._creature_grid[point]:
-                map.place(maybe_create(self._creature_grid[point]), point)
+                pending[self._creature_grid[point]].append(point)
+
+        for type_or_thing, points in pending.items():
+            if isinstance(type_or_thing, Entity):
+                for point in points:
+                    map.place(type_or_thing, point)
+            else:
+                entities = type_or_thing.create_many(len(points))
+                for entity, point in zip(entities, points):
+                    map.place(entity, point)
 
         return map
 
+    def to_compact(self):
+        """Squash the canvas down into a `CompactCanvas`, which is small and
+        can be pickled, so it can be sent between processes.
+        """
+        names = entity_type_names()
+        types = []
+        type_indices = {}
+
+        def index_of(entity_type):
+            try:
+                return type_indices[entity_type]
+            except KeyError:
+                pass
+            try:
+                name = names[entity_type]
+            except KeyError:
+                raise TypeError(
+                    "Can't compact {!r}; it's not defined in flax.entity"
+                    .format(entity_type))
+            type_indices[entity_type] = len(types)
+            types.append(name)
+            return type_indices[entity_type]
+
+        architecture = array('H')
+        items = []
+        creatures = []
+        entities = []
+        for cell, point in enumerate(self.rect.iter_points()):
+            arch = self._arch_grid[point]
+            if isinstance(arch, Entity):
+                # Actual entities (portals, damaged rubble) can't be sent
+                # as-is, but they're not on a map yet, so all there is to
+                # them is their type and their own component data
+                entities.append((cell, tuple(
+                    (_attribute_key(attribute), value)
+                    for attribute, value in arch.component_data.items())))
+                arch = arch.type
+            architecture.append(index_of(arch))
+
+            for item_type in self._item_grid[point]:
+                items.append((cell, index_of(item_type)))
+            if self._creature_grid[point]:
+                creatures.append((cell, index_of(self._creature_grid[point])))
+
+        return CompactCanvas(
+            self.rect.size, tuple(types), architecture.tobytes(),
+            tuple(items), tuple(creatures), tuple(entities))
+
+    @classmethod
+    def from_compact(cls, compact):
+        """Rebuild a canvas from a `CompactCanvas`."""
+        types = [getattr(e, name) for name in compact.types]
+        architecture = array('H')
+        architecture.frombytes(compact.architecture)
+        entities = dict(compact.entities)
+
+        self = cls(compact.size)
+        points = list(self.rect.iter_points())
+        for cell, (point, index) in enumerate(zip(points, architecture)):
+            arch = types[index]
+            if cell in entities:
+                arch = arch.restore({
+                    _attribute_from_key(key): value
+                    for key, value in entities[cell]})
+            self.set_architecture(point, arch)
+        for cell, index in compact.items:
+            self.add_item(points[cell], types[index])
+        for cell, index in compact.creatures:
+            self.set_creature(points[cell], types[index])
+        return self
+
+
+# A `MapCanvas` in a form that pickles small and quickly.  Entity types are
+# referred to by their index in `types`, which holds their names in
+# `flax.entity`; cells are numbered in `Rectangle.iter_points` order.
+# `architecture` is the packed u16 type index of every cell; `items` and
+# `creatures` are (cell, type index) pairs.  Where the architecture is an
+# actual entity rather than a type, `entities` has a (cell, component data)
+# pair, with the data's attributes given as `_attribute_key`s.
+CompactCanvas = namedtuple(
+    'CompactCanvas',
+    ['size', 'types', 'architecture', 'items', 'creatures', 'entities'])
+
+
+def _attribute_key(attribute):
+    interface = attribute.interface
+    return interface.__module__, interface.__name__, attribute.__name__
+
+
+def _attribute_from_key(key):
+    module, interface, name = key
+    return getattr(import_module(module), interface)[name]
+
+
+_entity_type_names = None
+
+
+def entity_type_names():
+    """Return a dict mapping every `EntityType` in `flax.entity` to its name
+    there, so types can be sent between processes by name.
+    """
+    global _entity_type_names
+    if _entity_type_names is None:
+        names = {}
+        for name, value in vars(e).items():
+            if isinstance(value, EntityType):
+                names.setdefault(value, name)
+        _entity_type_names = names
+    return _entity_type_names
+
+
+class MapSpec:
+    """Everything needed to generate a particular map, short of the random
+    number generator: which fractor to use, its arguments, and where the
+    map's stairs lead.  Unlike a lambda, can be pickled and sent to another
+    process.
+    """
+    def __init__(self, fractor_class, *args, up=None, down=None, **kwargs):
+        self.fractor_class = fractor_class
+        self.args = args
+        self.kwargs = kwargs
+        self.up = up
+        self.down = down
+
+    def __repr__(self):
+        return "<{} {} up={!r} down={!r}>".format(
+            type(self).__qualname__, self.fractor_class.__name__,
+            self.up, self.down)
+
+    @property
+    def connections(self):
+        return tuple(name for name in (self.up, self.down) if name)
+
+    def make_fractor(self, rng):
+        return self.fractor_class(*self.args, rng=rng, **self.kwargs)
+
+    def generate_canvas(self, rng):
+        return self.make_fractor(rng).generate_canvas(self.up, self.down)
+
+
+def generate_compact(spec, seed):
+    """Generate a map from `spec` and `seed`, and return it as a
+    `CompactCanvas`, along with how many seconds that took.
+
+    This is the one function that runs in the background, whether in a worker
+    process or a thread, so it sends back the compact form rather than a real
+    canvas: that pickles cheaply and doesn't touch any entity registry.
+    """
+    started = time.perf_counter()
+    compact = spec.generate_canvas(random.Random(seed)).to_compact()
+    return compact, time.perf_counter() - started
+
+
+def generate_many(specs, seeds, *, workers=None, registry=None):
+    """Generate a map for each `MapSpec` in `specs`, seeding each one's random
+    number generator with the matching item from `seeds`, and return a list of
+    the finished maps in the same order.
+
+    The generating happens in a pool of `workers` processes (default: one per
+    core); only turning the results into maps happens here.  Maps come out
+    exactly as they would from generating them one at a time, and their
+    entities are registered with `registry` in order.  With ``workers=1``,
+    skips the pool and does everything in this process.
+    """
+    specs = list(specs)
+    seeds = list(seeds)
+    if len(specs) != len(seeds):
+        raise ValueError("Need exactly one seed per map spec")
+
+    if workers == 1:
+        canvases = [
+            spec.generate_canvas(random.Random(seed))
+            for spec, seed in zip(specs, seeds)]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            canvases = [
+                MapCanvas.from_compact(compact)
+                for compact, _ in executor.map(generate_compact, specs, seeds)]
+
+    return [canvas.to_map(registry) for canvas in canvases]
+
 
 class Room:
     """A room, which has not yet been drawn.
@@ -124,16 +321,16 @@ class Room:
         self.rect = rect
 
     @classmethod
-    def randomize(cls, region, *, minimum_size=Size(5, 5)):
+    def randomize(cls, region, *, minimum_size=Size(5, 5), rng=random):
         """Place a room randomly in a region, randomizing its size and position.
         """
         # TODO need to guarantee the region is big enough
         size = Size(
-            random_normal_range(minimum_size.width, region.width),
-            random_normal_range(minimum_size.height, region.height),
+            random_normal_range(minimum_size.width, region.width, rng),
+            random_normal_range(minimum_size.height, region.height, rng),
         )
-        left = region.left + random.randint(0, region.width - size.width)
-        top = region.top + random.randint(0, region.height - size.height)
+        left = region.left + rng.randint(0, region.width - size.width)
+        top = region.top + rng.randint(0, region.height - size.height)
         rect = Rectangle(Point(left, top), size)
 
         return cls(rect)
@@ -155,16 +352,28 @@ class Fractor:
     This is a base class, containing some generally-useful functionality; the
     interesting differentiation happens in subclasses.
     """
-    def __init__(self, map_size, region=None):
+    def __init__(self, map_size, region=None, *, rng=None):
         self.map_canvas = MapCanvas(map_size)
+        # All randomness should come from here, so that a seeded generator
+        # gives the same map every time
+        if rng is None:
+            rng = random.Random()
+        self.rng = rng
         if region is None:
             self.region = self.map_canvas.rect
         else:
             self.region = region
 
-    def generate_map(self, up=None, down=None):
+    def generate_map(self, up=None, down=None, registry=None):
         """The method you probably want to call.  Does some stuff, then spits
-        out a map.
+        out a map.  Its entities are registered with `registry`, if given.
+        """
+        return self.generate_canvas(up, down).to_map(registry)
+
+    def generate_canvas(self, up=None, down=None):
+        """Do all the actual generating, but stop short of making a map, and
+        return the `MapCanvas` instead.  Only touches the fractor's own
+        state, so it's safe to do in another thread.
         """
         self.generate()
         self.place_stuff()
@@ -180,7 +389,7 @@ class Fractor:
         if down:
             self.place_portal(StairsDown, down)
 
-        return self.map_canvas.to_map()
+        return self.map_canvas
 
     def generate(self):
         """Implement in subclasses.  Ought to do something to the canvas."""
@@ -190,7 +399,7 @@ class Fractor:
 
     def generate_room(self, region):
         # TODO lol not even using room_size
-        room = Room.randomize(region)
+        room = Room.randomize(region, rng=self.rng)
         room.draw_to_canvas(self.map_canvas)
 
     def place_stuff(self):
@@ -198,7 +407,7 @@ class Fractor:
         # variety yet of stuff to generate yet, so.
         assert self.map_canvas.floor_spaces, \
             "can't place player with no open spaces"
-        points = random.sample(list(self.map_canvas.floor_spaces), 10)
+        points = self.rng.sample(list(self.map_canvas.floor_spaces), 10)
         self.map_canvas.set_creature(points[0], Salamango)
         self.map_canvas.add_item(points[1], Armor)
         self.map_canvas.add_item(points[2], Potion)
@@ -213,7 +422,7 @@ class Fractor:
         # TODO not guaranteed
         assert self.map_canvas.floor_spaces, \
             "can't place portal with no open spaces"
-        point = random.choice(list(self.map_canvas.floor_spaces))
+        point = self.rng.choice(list(self.map_canvas.floor_spaces))
         self.map_canvas.set_architecture(point, portal)
 
 
@@ -225,8 +434,8 @@ class Fractor:
 class BinaryPartitionFractor(Fractor):
     # TODO should probably accept a (minimum) room size instead, and derive
     # minimum partition size from that
-    def __init__(self, *args, minimum_size):
-        super().__init__(*args)
+    def __init__(self, *args, minimum_size, **kwargs):
+        super().__init__(*args, **kwargs)
         self.minimum_size = minimum_size
 
     def generate(self):
@@ -275,7 +484,7 @@ class BinaryPartitionFractor(Fractor):
 
         assert top <= bottom
 
-        midpoint = random.randint(top, bottom + 1)
+        midpoint = self.rng.randint(top, bottom + 1)
 
         return [
             region.replace(bottom=midpoint),
@@ -290,7 +499,7 @@ class BinaryPartitionFractor(Fractor):
 
         assert left <= right
 
-        midpoint = random.randint(left, right + 1)
+        midpoint = self.rng.randint(left, right + 1)
 
         return [
             region.replace(right=midpoint),
@@ -354,7 +563,7 @@ class PerlinFractor(Fractor):
         # TODO i think this needs another flooding algorithm, which probably
         # means it needs to be a lot simpler and faster...
         noise_factory = discrete_perlin_noise_factory(
-            *self.region.size, resolution=2, octaves=1)
+            *self.region.size, resolution=2, octaves=1, rng=self.rng)
 
         noise = {
             point: abs(noise_factory(*point) - 0.5) * 2
@@ -372,11 +581,11 @@ class PerlinFractor(Fractor):
         river = {}
 
         center_factory = discrete_perlin_noise_factory(
-            self.region.height, resolution=3)
+            self.region.height, resolution=3, rng=self.rng)
         width_factory = discrete_perlin_noise_factory(
-            self.region.height, resolution=6, octaves=2)
+            self.region.height, resolution=6, octaves=2, rng=self.rng)
         center = random_normal_int(
-            self.region.center().x, self.region.width / 4 / 3)
+            self.region.center().x, self.region.width / 4 / 3, self.rng)
         for y in self.region.range_height():
             center += (center_factory(y) - 0.5) * 3
             width = width_factory(y) * 2 + 5
@@ -396,7 +605,7 @@ class PerlinFractor(Fractor):
         # travelled" -- low values are walked often (and are thus short grass),
         # high values are left alone (and thus are trees).
         noise_factory = discrete_perlin_noise_factory(
-            *self.region.size, resolution=6)
+            *self.region.size, resolution=6, rng=self.rng)
         noise = {
             point: noise_factory(*point)
             for point in self.region.iter_points()
@@ -449,7 +658,7 @@ class PerlinFractor(Fractor):
             blocks.append((start, end))
 
         for start, end in blocks:
-            y = random_normal_range(start, end)
+            y = random_normal_range(start, end, self.rng)
             span = river_blob.spans[y][0]
             local_minima.add(Point(span.start - 1, y))
             local_minima.add(Point(span.end + 1, y))
@@ -485,7 +694,8 @@ class PerlinFractor(Fractor):
         # Whoops time for another step: generating a surrounding cave wall.
         for edge in Direction.orthogonal:
             width = self.region.edge_length(edge)
-            wall_noise = discrete_perlin_noise_factory(width, resolution=6)
+            wall_noise = discrete_perlin_noise_factory(
+                width, resolution=6, rng=self.rng)
             for n in self.region.edge_span(edge):
                 offset = int(wall_noise(n) * 4 + 1)
                 for m in range(offset):
@@ -580,10 +790,12 @@ class PerlinFractor(Fractor):
             "can't place player with no open spaces"
 
         floor = self.map_canvas.floor_spaces
-        points = random.sample(list(floor), 1)
+        points = self.rng.sample(list(floor), 1)
         self.map_canvas.add_item(points[0], e.Key)
 
-def generate_caves(map_canvas, region, wall_tile, force_walls=(), force_floors=()):
+def generate_caves(
+        map_canvas, region, wall_tile, force_walls=(), force_floors=(),
+        rng=random):
     """Uses cellular automata to generate a cave system.
 
     Idea from: http://www.roguebasin.com/index.php?title=Cellular_Automata_Method_for_Generating_Random_Cave-Like_Levels
@@ -594,12 +806,15 @@ def generate_caves(map_canvas, region, wall_tile, force_walls=(), force_floors=(
     for point in force_floors:
         base_grid[point] = False
 
-    grid = {point: random.random() < 0.40 for point in region.iter_points()}
+    points = list(region.iter_points())
+    grid = {point: rng.random() < 0.40 for point in points}
     grid.update(base_grid)
+    # Every generation looks at the same neighbors, so only find them once
+    neighborhoods = [(point, point.neighbors) for point in points]
     for generation in range(5):
         next_grid = base_grid.copy()
-        for point in region.iter_points():
-            neighbors = grid[point] + sum(grid.get(neighbor, True) for neighbor in point.neighbors)
+        for point, point_neighbors in neighborhoods:
+            neighbors = grid[point] + sum(grid.get(neighbor, True) for neighbor in point_neighbors)
             # The 4-5 rule: the next gen is a wall if either:
             # - the current gen is a wall and 4+ neighbors are walls;
             # - the current gen is a space and 5+ neighbors are walls.
@@ -639,18 +854,18 @@ class RuinFractor(Fractor):
         # TODO it would be nice if i could really write all this without ever
         # having to hardcode a specific direction, so the logic could always be
         # rotated freely
-        side = random.choice([Direction.left, Direction.right])
+        side = self.rng.choice([Direction.left, Direction.right])
 
         # TODO assert region is big enough
         room_size = Size(
-            random_normal_range(9, int(self.region.width * 0.4)),
-            random_normal_range(9, int(self.region.height * 0.4)),
+            random_normal_range(9, int(self.region.width * 0.4), self.rng),
+            random_normal_range(9, int(self.region.height * 0.4), self.rng),
         )
 
         room_position = self.region.center() - room_size // 2
         room_position += Point(
-            random_normal_int(0, self.region.width * 0.1),
-            random_normal_int(0, self.region.height * 0.1),
+            random_normal_int(0, self.region.width * 0.1, self.rng),
+            random_normal_int(0, self.region.height * 0.1, self.rng),
         )
 
         room_rect = Rectangle(room_position, room_size)
@@ -671,7 +886,7 @@ class RuinFractor(Fractor):
                 floors.append(point + side)
         generate_caves(
             self.map_canvas, cave_area, CaveWall,
-            force_walls=walls, force_floors=floors,
+            force_walls=walls, force_floors=floors, rng=self.rng,
         )
 
         room.draw_to_canvas(self.map_canvas)
@@ -692,7 +907,7 @@ class RuinFractor(Fractor):
             self.map_canvas.set_architecture(Point(x, y), KadathGate)
 
         # Beat up the border of the room near the gate
-        y = random.choice(
+        y = self.rng.choice(
             tuple(range(room_rect.top, min_y))
             + tuple(range(max_y + 1, room_rect.bottom))
         )
@@ -704,7 +919,7 @@ class RuinFractor(Fractor):
                 # tile, or draw it later, or whatever.
                 if self.map_canvas._arch_grid[point] is not CaveWall:
                     distance = abs(dx) + abs(dy)
-                    ruination = random_normal_range(0, 0.2) + distance * 0.2
+                    ruination = random_normal_range(0, 0.2, self.rng) + distance * 0.2
                     self.map_canvas.set_architecture(
                         point, e.Rubble(Breakable(ruination)))
 
@@ -712,7 +927,7 @@ class RuinFractor(Fractor):
         border = list(room_rect.iter_border())
         # TODO don't do this infinitely; give up after x tries
         while True:
-            point, edge = random.choice(border)
+            point, edge = self.rng.choice(border)
             if self.map_canvas._arch_grid[point + edge] is CaveWall:
                 break
         self.map_canvas.set_architecture(point, CaveWall)
@@ -729,7 +944,7 @@ class RuinFractor(Fractor):
 
         cave_floor = frozenset(self.cave_region.iter_points())
         cave_floor &= self.map_canvas.floor_spaces
-        points = random.sample(list(cave_floor), 5)
+        points = self.rng.sample(list(cave_floor), 5)
         from flax.component import Portal
         # TODO this should exit.  also confirm.  should be part of the ladder
         # entity?  also, world doesn't place you here.  maybe the map itself
@@ -766,7 +981,8 @@ class RuinedHallFractor(Fractor):
         # First create a bunch of hallways and rooms.
         # For now, just carve a big area, run a hallway through the middle, and
         # divide either side into rooms.
-        area = Room.randomize(self.region, minimum_size=self.region.size // 2)
+        area = Room.randomize(
+            self.region, minimum_size=self.region.size // 2, rng=self.rng)
         area.draw_to_canvas(self.map_canvas)
 
         center = area.rect.center()
@@ -794,7 +1010,8 @@ class RuinedHallFractor(Fractor):
             # use 1/3 the maximum as the minimum.  (Plus 1, to avoid rounding down
             # to zero.)
             minimum_rooms = maximum_rooms // 6 + 1
-            num_rooms = random_normal_range(minimum_rooms, maximum_rooms)
+            num_rooms = random_normal_range(
+                minimum_rooms, maximum_rooms, self.rng)
 
             # TODO normal distribution doesn't have good results here.  think
             # more about how people use rooms -- often many of similar size,
@@ -808,7 +1025,7 @@ class RuinedHallFractor(Fractor):
                 min_width = minimum_width
                 avg_width = (space.width - 1) // num_rooms + 1
                 max_width = space.width - (minimum_width - 1) * (num_rooms - 1)
-                room_width = random_normal_int(avg_width, min(max_width - avg_width, avg_width - min_width) // 3)
+                room_width = random_normal_int(avg_width, min(max_width - avg_width, avg_width - min_width) // 3, self.rng)
 
                 room = space.replace(right=space.left + room_width - 1)
                 rooms.append(room)
@@ -823,9 +1040,9 @@ class RuinedHallFractor(Fractor):
         from flax.component import Lockable
 
         # Add some doors for funsies.
-        locked_room = random.choice(rooms)
+        locked_room = self.rng.choice(rooms)
         for rect in rooms:
-            x = random.randrange(rect.left + 1, rect.right - 1)
+            x = self.rng.randrange(rect.left + 1, rect.right - 1)
             if rect.top > hallway.top:
                 side = Direction.down
             else:
@@ -850,7 +1067,7 @@ class RuinedHallFractor(Fractor):
         hall_floors = floor_spaces & frozenset(self.hallway_area.iter_points())
         lock_floors = floor_spaces & frozenset(self.locked_area.iter_points())
 
-        points = random.sample(list(room_floors), 8)
+        points = self.rng.sample(list(room_floors), 8)
         self.map_canvas.set_creature(points[0], Salamango)
         self.map_canvas.set_creature(points[1], Salamango)
         self.map_canvas.set_creature(points[2], Salamango)
@@ -860,7 +1077,7 @@ class RuinedHallFractor(Fractor):
         self.map_canvas.add_item(points[6], e.Gem)
         self.map_canvas.add_item(points[7], e.Crate)
 
-        points = random.sample(list(lock_floors), 1)
+        points = self.rng.sample(list(lock_floors), 1)
         self.map_canvas.add_item(points[0], e.Crown)
 
     def place_portal(self, portal_type, destination):
@@ -879,10 +1096,10 @@ class RuinedHallFractor(Fractor):
 
         if portal_type is e.StairsDown:
             # Down stairs go in an unlocked room
-            point = random.choice(list(room_floors))
+            point = self.rng.choice(list(room_floors))
         else:
             # Up stairs go in the hallway
-            point = random.choice(list(hall_floors))
+            point = self.rng.choice(list(hall_floors))
         self.map_canvas.set_architecture(point, portal)
 
 
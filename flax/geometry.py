@@ -20,13 +20,16 @@ class Direction(Enum):
     left = (-1, 0)
     up_left = (-1, -1)
 
+    # These are tuples rather than sets so they always iterate in the same
+    # order; enum hashes change from run to run, and map generation has to be
+    # repeatable
     @classproperty
     def orthogonal(cls):
-        return frozenset((cls.up, cls.down, cls.left, cls.right))
+        return (cls.up, cls.down, cls.left, cls.right)
 
     @classproperty
     def diagonal(cls):
-        return frozenset((cls.up_left, cls.up_right, cls.down_left, cls.down_right))
+        return (cls.up_left, cls.up_right, cls.down_left, cls.down_right)
 
     def adjacent_to(self, other):
         return (
@@ -41,12 +44,18 @@ class Direction(Enum):
         return Direction((- self.value[0], - self.value[1]))
 
 
+_DIRECTION_OFFSETS = tuple(direction.value for direction in Direction)
 
 
 class Point(tuple):
     def __new__(cls, x, y):
         return tuple.__new__(cls, (x, y))
 
+    def __getnewargs__(self):
+        # So these pickle; tuple's own version would pass the whole tuple to
+        # __new__ as a single argument
+        return tuple(self)
+
     @classmethod
     def origin(cls):
         return cls(0, 0)
@@ -61,7 +70,10 @@ class Point(tuple):
 
     @property
     def neighbors(self):
-        return [self + d for d in Direction]
+        # This is called a lot during map generation, so skip __add__ and the
+        # Enum machinery
+        x, y = self
+        return [Point(x + dx, y + dy) for dx, dy in _DIRECTION_OFFSETS]
 
     def __add__(self, other):
         if isinstance(other, Direction):
@@ -90,6 +102,9 @@ class Size(tuple):
         assert height >= 0
         return super().__new__(cls, (width, height))
 
+    def __getnewargs__(self):
+        return tuple(self)
+
     def __floordiv__(self, n):
         if not isinstance(n, (int, float)):
             return NotImplemented
@@ -118,6 +133,10 @@ class Span(tuple):
     def __new__(cls, start, end):
         return super().__new__(cls, (start, end))
 
+    def __getnewargs__(self):
+        # Iterating a span gives every number in it, so be explicit
+        return self.start, self.end
+
     @property
     def start(self):
         return self[0]
@@ -210,6 +229,9 @@ class Rectangle(tuple):
     def __new__(cls, origin, size):
         return super().__new__(cls, (origin, size))
 
+    def __getnewargs__(self):
+        return tuple(self)
+
     @classmethod
     def from_edges(cls, *, top, bottom, left, right):
         return cls(Point(left, top), Size(right - left + 1, bottom - top + 1))
@@ -0,0 +1,259 @@
+"""Recording and replaying games.
+
+A journal holds everything needed to play a game out again exactly: the
+world's seed, every action the player took, and where each turn ended.  Each
+turn record also carries a checksum of the world's state (see
+`World.checksum`), so a replay can tell exactly where it stopped matching the
+original.
+
+Since a replay runs headlessly and as fast as it can, a journal also makes a
+decent benchmark: it's a real game, not a synthetic one.
+
+The format is binary and compact:
+
+    header:  b'FLXJ', version (u8), seed (u64)
+    action:  b'A', event type (u8), then each of the event's `fields`
+    turn:    b'T', turn number (u32), checksum (u32)
+
+Field values are a one-byte tag followed by the value: ``e`` and an entity id
+(u32), ``d`` and a `Direction` index (u8), ``i`` and an integer (i64), ``s``
+and a string (u8 length, then UTF-8), or just ``n`` for None.  Everything is
+little-endian.
+
+Version 2 added strings (for `Teleport`); version 1 journals still read fine.
+"""
+from collections import namedtuple
+import os
+import struct
+import time
+
+from flax.entity import Entity
+from flax.event import (
+    Walk, Descend, Ascend, Open, Unlock, PickUp, Equip, Unequip, MeleeAttack,
+    Damage, Die, Teleport,
+)
+from flax.geometry import Direction
+
+
+MAGIC = b'FLXJ'
+VERSION = 2
+
+# Journals refer to event types and directions by their position in these
+# lists, so only ever add to the ends!
+EVENT_TYPES = (
+    Walk, Descend, Ascend, Open, Unlock, PickUp, Equip, Unequip, MeleeAttack,
+    Damage, Die, Teleport,
+)
+EVENT_CODES = {event_type: code for code, event_type in enumerate(EVENT_TYPES)}
+DIRECTIONS = tuple(Direction)
+DIRECTION_CODES = {direction: code for code, direction in enumerate(DIRECTIONS)}
+
+_header = struct.Struct('<4sBQ')
+_u8 = struct.Struct('<B')
+_u32 = struct.Struct('<I')
+_i64 = struct.Struct('<q')
+_turn = struct.Struct('<II')
+
+
+class JournalError(Exception):
+    pass
+
+
+class JournalMismatch(JournalError):
+    """A replay didn't end up in the same state as the original game."""
+    def __init__(self, turn, expected, actual):
+        super().__init__(
+            "World diverged from the journal at turn {}: checksum {:08x}, "
+            "expected {:08x}".format(turn, actual, expected))
+        self.turn = turn
+        self.expected = expected
+        self.actual = actual
+
+
+# What a journal reads back as.  Entities come back as EntityIds, since they
+# only mean anything relative to a particular world
+EntityId = namedtuple('EntityId', ['id'])
+Action = namedtuple('Action', ['event_type', 'args'])
+Turn = namedtuple('Turn', ['turn', 'checksum'])
+
+
+class JournalWriter:
+    """Writes a journal to a binary file object.  Hang one off of
+    `World.journal` and the world will feed it.
+    """
+    def __init__(self, file, seed):
+        if not 0 <= seed < 2 ** 64:
+            raise ValueError(
+                "Can't record a world with seed {!r}; journals need a 64-bit "
+                "unsigned integer".format(seed))
+        self.file = file
+        self.file.write(_header.pack(MAGIC, VERSION, seed))
+
+    @classmethod
+    def open(cls, path, seed):
+        return cls(open(path, 'wb'), seed)
+
+    def record_action(self, event):
+        event_type = type(event)
+        try:
+            code = EVENT_CODES[event_type]
+        except KeyError:
+            raise TypeError(
+                "Don't know how to journal a {} event"
+                .format(event_type.__name__))
+
+        parts = [b'A', _u8.pack(code)]
+        for name in event_type.fields:
+            parts.append(_encode_value(getattr(event, name)))
+        self.file.write(b''.join(parts))
+
+    def record_turn(self, turn, checksum):
+        self.file.write(b'T' + _turn.pack(turn, checksum))
+        # Turns are where it's worth making sure everything's on disk, in case
+        # whatever's being recorded is a crash
+        self.file.flush()
+
+    def sync(self):
+        """Wait for everything recorded so far to actually hit the disk.
+        (Turns are already flushed, but that only gets them as far as the
+        OS.)
+        """
+        os.fsync(self.file.fileno())
+
+    def close(self):
+        self.file.close()
+
+
+def _encode_value(value):
+    if value is None:
+        return b'n'
+    elif isinstance(value, Entity):
+        return b'e' + _u32.pack(value.id)
+    elif isinstance(value, Direction):
+        return b'd' + _u8.pack(DIRECTION_CODES[value])
+    elif isinstance(value, int):
+        return b'i' + _i64.pack(value)
+    elif isinstance(value, str):
+        data = value.encode('utf8')
+        if len(data) > 255:
+            raise ValueError(
+                "Can't journal a string that long: {!r}".format(value))
+        return b's' + _u8.pack(len(data)) + data
+    else:
+        raise TypeError("Can't journal a value like {!r}".format(value))
+
+
+class JournalReader:
+    """Reads a journal back from a binary file object.  Iterate over it to
+    get `Action` and `Turn` records, in order.
+    """
+    def __init__(self, file):
+        self.file = file
+        header = file.read(_header.size)
+        if len(header) < _header.size:
+            raise JournalError("File is too short to be a journal")
+        magic, version, self.seed = _header.unpack(header)
+        if magic != MAGIC:
+            raise JournalError("Not a journal file")
+        if not 1 <= version <= VERSION:
+            raise JournalError(
+                "Don't know how to read journal version {}".format(version))
+
+    @classmethod
+    def open(cls, path):
+        return cls(open(path, 'rb'))
+
+    def _read(self, struct):
+        data = self.file.read(struct.size)
+        if len(data) < struct.size:
+            raise JournalError("Journal ends in the middle of a record")
+        return struct.unpack(data)
+
+    def _read_value(self):
+        tag = self.file.read(1)
+        if tag == b'n':
+            return None
+        elif tag == b'e':
+            return EntityId(self._read(_u32)[0])
+        elif tag == b'd':
+            return DIRECTIONS[self._read(_u8)[0]]
+        elif tag == b'i':
+            return self._read(_i64)[0]
+        elif tag == b's':
+            length = self._read(_u8)[0]
+            data = self.file.read(length)
+            if len(data) < length:
+                raise JournalError("Journal ends in the middle of a record")
+            return data.decode('utf8')
+        else:
+            raise JournalError("Unknown value tag {!r}".format(tag))
+
+    def __iter__(self):
+        while True:
+            kind = self.file.read(1)
+            if not kind:
+                return
+            elif kind == b'A':
+                event_type = EVENT_TYPES[self._read(_u8)[0]]
+                args = tuple(self._read_value() for _ in event_type.fields)
+                yield Action(event_type, args)
+            elif kind == b'T':
+                yield Turn(*self._read(_turn))
+            else:
+                raise JournalError("Unknown record type {!r}".format(kind))
+
+    def close(self):
+        self.file.close()
+
+
+def build_event(world, action):
+    """Turn an `Action` back into an event, in the given world."""
+    args = [
+        world.entities[arg.id] if isinstance(arg, EntityId) else arg
+        for arg in action.args
+    ]
+    return action.event_type(*args)
+
+
+ReplayResult = namedtuple(
+    'ReplayResult', ['world', 'turns', 'actions', 'elapsed', 'finished'])
+
+
+def replay(file, *, verify=True):
+    """Play a journal back, as fast as possible, and return a `ReplayResult`.
+    `file` may be a path or a binary file object.
+
+    With `verify`, checks the world's state after every turn and raises
+    `JournalMismatch` as soon as it differs from the original game.
+    """
+    from flax.component import GameOver
+    from flax.world import World
+
+    if isinstance(file, str):
+        reader = JournalReader.open(file)
+    else:
+        reader = JournalReader(file)
+
+    started = time.perf_counter()
+    world = World(seed=reader.seed)
+    turns = actions = 0
+    finished = False
+    for record in reader:
+        if isinstance(record, Action):
+            world.push_player_action(build_event(world, record))
+            actions += 1
+            continue
+
+        try:
+            world.advance()
+        except GameOver:
+            finished = True
+        turns += 1
+
+        if verify:
+            checksum = world.checksum()
+            if world.turn != record.turn or checksum != record.checksum:
+                raise JournalMismatch(record.turn, record.checksum, checksum)
+
+    return ReplayResult(
+        world, turns, actions, time.perf_counter() - started, finished)
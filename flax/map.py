@@ -1,16 +1,35 @@
-from weakref import WeakKeyDictionary, ref
+from weakref import ref
 
+from flax.column import ColumnStore
 from flax.component import IPortal
 from flax.geometry import Point
-from flax.entity import Entity, Layer, Player
+from flax.entity import Entity, EntityRegistry, Layer, Player
 
 
 class Map:
-    def __init__(self, size):
+    def __init__(self, size, registry=None):
         self.rect = size.to_rect(Point.origin())
 
-        self.entity_positions = WeakKeyDictionary()
+        # Entities get ids when they're placed on a map.  Normally the world
+        # passes its registry in, but a map on its own can have its own.
+        if registry is None:
+            registry = EntityRegistry()
+        self.registry = registry
+
+        # Entity id => position
+        self.entity_positions = {}
+        # Bumped whenever anything is placed, moved, or removed, so anything
+        # drawing the map can tell whether it needs to bother
+        self.version = 0
+        # The turn the player last left this map, if they're not on it
+        self.left_turn = None
         self.portal_index = {}
+        self.columns = ColumnStore()
+
+        # EntityType => ordered dict of the entities of that type on this map,
+        # or None if no query has cared about that type yet.  See `query`.
+        self._archetypes = {}
+        self._queries = {}
 
         self.tiles = {
             point: Tile(self, point)
@@ -18,6 +37,9 @@ class Map:
         }
 
     _player = None
+    # Called with every entity placed on the map, if set.  The world uses it
+    # to notice new actors on the current map
+    on_place = None
 
     @property
     def player(self):
@@ -42,44 +64,140 @@ class Map:
             yield (self.tiles[Point(x, y)] for x in self.rect.range_width())
 
     def place(self, entity, position):
-        assert entity not in self.entity_positions
-        self.entity_positions[entity] = position
+        self.version += 1
+        self.registry.register(entity)
+        assert entity.id not in self.entity_positions
+        self.entity_positions[entity.id] = position
         self.tiles[position].attach(entity)
+        self.columns.bind(entity)
+        self._index_archetype(entity)
 
         if entity.isa(Player):
             self.player = entity
-        if IPortal in entity.type.components:
+        if IPortal in entity:
             dest = IPortal(entity).destination
             assert dest not in self.portal_index
             self.portal_index[dest] = entity
 
+        if self.on_place is not None:
+            self.on_place(entity)
+
     def find(self, entity):
         assert isinstance(entity, Entity)
-        pos = self.entity_positions[entity]
+        pos = self.entity_positions[entity.id]
         return self.tiles[pos]
 
     def move(self, entity, position):
-        old_position = self.entity_positions[entity]
+        self.version += 1
+        old_position = self.entity_positions[entity.id]
         old_tile = self.tiles[old_position]
         old_tile.detach(entity)
 
-        self.entity_positions[entity] = position
+        self.entity_positions[entity.id] = position
         new_tile = self.tiles[position]
         new_tile.attach(entity)
 
     def remove(self, entity):
-        position = self.entity_positions.pop(entity)
+        self.version += 1
+        position = self.entity_positions.pop(entity.id)
         self.tiles[position].detach(entity)
+        self.columns.unbind(entity)
+        members = self._archetypes.get(entity.type)
+        if members is not None:
+            del members[entity]
 
         if entity.isa(Player):
             del self.player
-        if IPortal in entity.type.components:
+        if IPortal in entity:
             dest = IPortal(entity).destination
             del self.portal_index[dest]
 
     def __contains__(self, position):
         return position in self.rect
 
+    def query(self, *requirements):
+        """Return a live `ArchetypeQuery` over every entity on this map that
+        supports all of the given interfaces or component classes.
+
+        Queries are cached, and their membership is kept up to date as
+        entities are placed and removed, so iterating one only ever touches
+        entities that match.
+        """
+        key = frozenset(requirements)
+        try:
+            return self._queries[key]
+        except KeyError:
+            pass
+
+        query = self._queries[key] = ArchetypeQuery(key)
+
+        backfill = {}
+        for entity_type, members in self._archetypes.items():
+            if not query.matches(entity_type):
+                continue
+            if members is None:
+                # Nobody was tracking this type before, so we need to go find
+                # all of its entities
+                members = backfill[entity_type] = {}
+                self._archetypes[entity_type] = members
+            query.groups.append(members)
+
+        if backfill:
+            for tile in self.tiles.values():
+                for entity in tile.entities:
+                    members = backfill.get(entity.type)
+                    if members is not None:
+                        members[entity] = None
+
+        return query
+
+    def _index_archetype(self, entity):
+        try:
+            members = self._archetypes[entity.type]
+        except KeyError:
+            # First time we've seen this type; only bother tracking it if
+            # some query wants it
+            members = None
+            for query in self._queries.values():
+                if query.matches(entity.type):
+                    if members is None:
+                        members = {}
+                    query.groups.append(members)
+            self._archetypes[entity.type] = members
+
+        if members is not None:
+            members[entity] = None
+
+
+class ArchetypeQuery:
+    """All the entities on a map that support some set of interfaces or
+    component classes.  Get one from `Map.query`.
+
+    Entities are grouped by type ("archetype"), and each group is shared
+    with every other query that matches that type.  Iterating produces the
+    current members; it's safe to place or remove entities while iterating,
+    though an entity removed partway through may still be produced.
+    """
+    def __init__(self, requirements):
+        self.requirements = requirements
+        self.groups = []
+
+    def matches(self, entity_type):
+        return self.requirements <= entity_type.capabilities
+
+    def __iter__(self):
+        for members in self.groups:
+            yield from list(members)
+
+    def __len__(self):
+        return sum(len(members) for members in self.groups)
+
+    def __bool__(self):
+        return any(self.groups)
+
+    def __contains__(self, entity):
+        return any(entity in members for members in self.groups)
+
 
 class Tile:
     def __init__(self, map, position):
@@ -17,7 +17,7 @@ def lerp(t, a, b):
     return a + t * (b - a)
 
 
-def perlin_noise_factory(*resolution):
+def perlin_noise_factory(*resolution, rng=random):
     """Return a function that will produce Perlin noise for an arbitrary point
     in an arbitrary number of dimensions.
 
@@ -32,6 +32,8 @@ def perlin_noise_factory(*resolution):
     floats in [0, 1).  You should, of course, pass the same number of
     arguments to `noise` as you did to this function.  `noise` returns a single
     value in the range [0, 1].
+
+    Pass a `random.Random` as `rng` to get repeatable noise.
     """
     # Perlin noise is a bit weird.  I picked it up from this general
     # explanation and explanation of the algorithm, respectively:
@@ -60,7 +62,7 @@ def perlin_noise_factory(*resolution):
         # this is the same as a random unit vector in n dimensions.  Thanks
         # to: http://mathworld.wolfram.com/SpherePointPicking.html
         # Pick n normal random variables with stddev 1
-        random_point = [random.gauss(0, 1) for _ in range(dimension)]
+        random_point = [rng.gauss(0, 1) for _ in range(dimension)]
         # Then scale the result to a unit vector
         scale = sum(n * n for n in random_point) ** -0.5
         gradients[point] = tuple(coord * scale for coord in random_point)
@@ -123,7 +125,7 @@ def perlin_noise_factory(*resolution):
 
 # TODO probably get octaves out of here and put it...  somewhere else?
 # wrapper?  should these all just be classes?  jesus
-def discrete_perlin_noise_factory(*dimensions, resolution, octaves=1):
+def discrete_perlin_noise_factory(*dimensions, resolution, octaves=1, rng=random):
     """Return a function that produces Perlin noise for a discrete grid.
     Helpful if you're writing, oh I don't know, a roguelike.
 
@@ -156,7 +158,7 @@ def discrete_perlin_noise_factory(*dimensions, resolution, octaves=1):
     original_noises = []
     for o in range(octaves):
         resolutions = (resolution * 2 ** o,) * dimension
-        original_noises.append(perlin_noise_factory(*resolutions))
+        original_noises.append(perlin_noise_factory(*resolutions, rng=rng))
 
     def noise(*point):
         assert len(point) == dimension
@@ -1,61 +1,6 @@
-import weakref
-
 import flax.event as event
 
 
-class WeakProperty:
-    """Descriptor that automatically holds onto whatever it contains as a weak
-    reference.  Reading this attribute will never raise `AttributeError`; if
-    the reference is broken or missing, you'll just get `None`.
-
-    The actual weak reference is stored in the object's `__dict__` under the
-    given name, so this acts as sort of a transparent proxy that lets you
-    forget you're dealing with weakrefs at all.
-
-    Of course, if you try to assign a value that can't be weak referenced,
-    you'll get a `TypeError`.  So don't do that.
-
-    Example:
-
-        class Foo:
-            bar = WeakProperty('bar')
-
-        obj = object()
-        foo = Foo()
-        foo.bar = obj
-        print(foo.bar)  # <object object at ...>
-        assert foo.bar is obj
-        del obj
-        print(foo.bar)  # None
-
-    Note that due to the `__dict__` twiddling, this descriptor will never
-    trigger `__getattr__`, `__setattr__`, or `__delattr__`.
-    """
-    def __init__(self, name):
-        self.name = name
-
-    def __get__(desc, self, cls):
-        if self is None:
-            return desc
-
-        try:
-            ref = self.__dict__[desc.name]
-        except KeyError:
-            return None
-        else:
-            value = ref()
-            if value is None:
-                # No sense leaving a dangling weakref around
-                del self.__dict__[desc.name]
-            return value
-
-    def __set__(desc, self, value):
-        self.__dict__[desc.name] = weakref.ref(value)
-
-    def __delete__(desc, self):
-        del self.__dict__[desc.name]
-
-
 # TODO ok so the problems i need to solve are
 # - when equipment is worn (received a Wear event), create a relation
 # - when checking for stats, look through modifiers:
@@ -77,41 +22,226 @@ class Relation:
     """Some kind of relationship that exists between two entities.  Common
     example is containment: if an item is in the player's inventory, then the
     player contains the item, and a relation `Contains(player, item)` exists.
+
+    Think of it as a triple: subject (``from_entity``), predicate (the
+    relation class), and object (``to_entity``).  Relations live in the
+    `RelationStore` belonging to the entities' `EntityRegistry`, so both
+    entities must be registered with the same world.  The relation itself
+    only holds onto their ids; if either entity is released, the
+    corresponding property becomes `None`.
     """
 
-    from_entity = WeakProperty('from_entity')
-    to_entity = WeakProperty('to_entity')
+    # Event classes fired, as ``hook(from_entity, to_entity)``, when a
+    # relation is created or destroyed through `CreateRelationEvent` or
+    # `DestroyRelationEvent`
+    on_create = None
+    on_destroy = None
 
     def __init__(self, from_entity, to_entity):
-        # TODO need to break this relation somehow if one side or the other is
-        # destroyed -- or maybe that's the responsibility of Entity, and this
-        # should yell instead?
-        self.from_entity = from_entity
-        self.to_entity = to_entity
+        # Note that when either entity is destroyed, the world will destroy
+        # this relation too; see `World.destroy_entity`
+        registry = from_entity.registry
+        if registry is None or to_entity.registry is not registry:
+            raise TypeError(
+                "Can't relate {!r} and {!r}; both must be registered with the "
+                "same world".format(from_entity, to_entity))
+
+        self.registry = registry
+        self.from_id = from_entity.id
+        self.to_id = to_entity.id
 
         self.attach()
 
+    def __repr__(self):
+        return "<{}: {!r} -> {!r}>".format(
+            type(self).__qualname__, self.from_entity, self.to_entity)
+
+    @property
+    def from_entity(self):
+        return self.registry.get(self.from_id)
+
+    @property
+    def to_entity(self):
+        return self.registry.get(self.to_id)
+
     @classmethod
     def create(cls, from_entity, to_entity):
         relation = cls(from_entity, to_entity)
         return CreateRelationEvent(relation)
 
     def attach(self):
-        cls = type(self)
-        self.from_entity.relates_to[cls].add(self)
-        self.to_entity.related_to[cls].add(self)
+        self.registry.relations.add(self)
 
     def destroy(self):
         return self.detach()
         return DestroyRelationEvent(self)
 
     def detach(self):
-        cls = type(self)
-        self.from_entity.relates_to[cls].remove(self)
-        self.to_entity.related_to[cls].remove(self)
+        self.registry.relations.remove(self)
+
+
+class RelationStore:
+    """Every relation between the entities in a world, indexed by (subject,
+    predicate), (predicate, object), and (subject, predicate, object).  All of
+    those lookups, plus adding and removing a relation, are O(1).  Entities
+    are indexed by id.
+
+    Two entities may be related in any number of different ways, but only
+    once per relation type.
+
+    Anything that wants to know when relations change can add a callable to
+    `listeners`; it'll be called with ``(relation, attached)``.  The store
+    also keeps a cache of values derived from an entity's relations (see
+    `derived`), which is thrown away whenever a relation touching that entity
+    changes.
+    """
+    def __init__(self):
+        # subject id => predicate => object id => relation
+        self._outgoing = {}
+        # object id => predicate => subject id => relation
+        self._incoming = {}
+        # entity id => key => derived value
+        self._derived = {}
+        self.listeners = []
+
+    def __len__(self):
+        return sum(
+            len(objects)
+            for predicates in self._outgoing.values()
+            for objects in predicates.values())
+
+    def add(self, relation):
+        """Add a relation.  Returns False, and does nothing, if the same
+        relation between the same entities already exists.
+        """
+        subject_id = relation.from_id
+        object_id = relation.to_id
+        predicate = type(relation)
+
+        objects = self._outgoing.setdefault(subject_id, {}).setdefault(
+            predicate, {})
+        if object_id in objects:
+            return False
+        objects[object_id] = relation
+        self._incoming.setdefault(object_id, {}).setdefault(
+            predicate, {})[subject_id] = relation
+
+        self._changed(relation, True)
+        return True
+
+    def remove(self, relation):
+        subject_id = relation.from_id
+        object_id = relation.to_id
+        predicate = type(relation)
+
+        _remove_index_entry(self._outgoing, subject_id, predicate, object_id)
+        _remove_index_entry(self._incoming, object_id, predicate, subject_id)
+
+        self._changed(relation, False)
+
+    def __contains__(self, relation):
+        try:
+            found = self._outgoing[relation.from_id][type(relation)][
+                relation.to_id]
+        except KeyError:
+            return False
+        return found is relation
+
+    def touching(self, entity):
+        """Return a list of every relation `entity` is part of, in either
+        direction.
+        """
+        relations = list(self.outgoing(entity))
+        relations.extend(self.incoming(entity))
+        return relations
+
+    def purge(self, entity):
+        """Remove every relation `entity` is part of, in one go, and forget
+        anything derived from them.  Returns the relations removed.
+        """
+        entity_id = entity.id
+        removed = []
+        for predicate, objects in self._outgoing.pop(entity_id, _EMPTY).items():
+            for object_id, relation in objects.items():
+                if object_id != entity_id:
+                    _remove_index_entry(
+                        self._incoming, object_id, predicate, entity_id)
+                removed.append(relation)
+        for predicate, subjects in self._incoming.pop(entity_id, _EMPTY).items():
+            for subject_id, relation in subjects.items():
+                if subject_id != entity_id:
+                    _remove_index_entry(
+                        self._outgoing, subject_id, predicate, entity_id)
+                    removed.append(relation)
+
+        for relation in removed:
+            self._changed(relation, False)
+        self._derived.pop(entity_id, None)
+        return removed
+
+    def _changed(self, relation, attached):
+        self._derived.pop(relation.from_id, None)
+        self._derived.pop(relation.to_id, None)
+        for listener in self.listeners:
+            listener(relation, attached)
+
+    def get(self, subject, predicate, object):
+        """Return the relation of the given type between the two entities, or
+        None.
+        """
+        try:
+            return self._outgoing[subject.id][predicate][object.id]
+        except KeyError:
+            return None
+
+    def objects(self, subject, predicate):
+        """Return a mapping of object id => relation, for every relation of
+        the given type that `subject` is the subject of.  Don't modify it.
+        """
+        return self._outgoing.get(subject.id, _EMPTY).get(predicate, _EMPTY)
+
+    def subjects(self, predicate, object):
+        """Return a mapping of subject id => relation, for every relation of
+        the given type that `object` is the object of.  Don't modify it.
+        """
+        return self._incoming.get(object.id, _EMPTY).get(predicate, _EMPTY)
+
+    def outgoing(self, subject):
+        """Iterate over every relation `subject` is the subject of."""
+        for objects in self._outgoing.get(subject.id, _EMPTY).values():
+            yield from objects.values()
+
+    def incoming(self, object):
+        """Iterate over every relation `object` is the object of."""
+        for subjects in self._incoming.get(object.id, _EMPTY).values():
+            yield from subjects.values()
+
+    def derived(self, entity, key, compute):
+        """Return ``compute(self, entity)``, cached until some relation
+        touching `entity` changes.
+        """
+        try:
+            return self._derived[entity.id][key]
+        except KeyError:
+            pass
+
+        value = compute(self, entity)
+        self._derived.setdefault(entity.id, {})[key] = value
+        return value
+
+
+_EMPTY = {}
+
 
-        del self.from_entity
-        del self.to_entity
+def _remove_index_entry(index, outer, predicate, inner):
+    by_predicate = index[outer]
+    entries = by_predicate[predicate]
+    del entries[inner]
+    # Don't leave empty dicts lying around
+    if not entries:
+        del by_predicate[predicate]
+        if not by_predicate:
+            del index[outer]
 
 
 # TODO is this a weird way to re-add "default" behavior, i don't know
@@ -131,18 +261,31 @@ class CreateRelationEvent:
 
 
 class DestroyRelationEvent:
-    def __init__(self, relation):
+    """Destroys a relation, after firing its ``on_destroy`` hook (if any).
+
+    Normally the hook can cancel the destruction.  A `forced` destruction,
+    e.g. because one of the entities is being destroyed, fires the hook but
+    goes ahead regardless.
+    """
+    def __init__(self, relation, *, forced=False):
         self.relation = relation
         self.target = relation.to_entity
+        self.forced = forced
 
     def fire(self, world):
-        subevent = self.relation.on_destroy(
-            self.relation.from_entity,
-            self.relation.to_entity,
-        )
-        subevent.fire(world)
-        if not subevent.cancelled:
-            self.relation.detach()
+        relation = self.relation
+        if relation.on_destroy is not None:
+            subevent = relation.on_destroy(
+                relation.from_entity,
+                relation.to_entity,
+            )
+            subevent.fire(world)
+            if subevent.cancelled and not self.forced:
+                return
+
+        # The hook may well have removed the relation itself
+        if relation in relation.registry.relations:
+            relation.detach()
 
 
 class Wearing(Relation):
@@ -150,11 +293,120 @@ class Wearing(Relation):
 
     # TODO finish me!!
 
-"""
-class Contains:
-    on_create = event.Take
-    on_destroy = event.Drop
-"""
+class Contains(Relation):
+    """The subject is holding the object: an item in a creature's inventory,
+    or in a crate, or in a crate in a creature's inventory.
+    """
+    # TODO want Take/Drop hooks here eventually, once those events exist
+
+
+class _ContentsSummary:
+    __slots__ = ('contents', 'ids', 'counts')
+
+    def __init__(self, contents, ids, counts):
+        self.contents = contents
+        self.ids = ids
+        self.counts = counts
+
+
+class ContainmentGraph:
+    """Answers questions about what's inside what, all the way down: items in
+    crates in crates in the player's inventory.
+
+    Built on the `Contains` relations in a registry's `RelationStore`.  The
+    full contents of each holder are worked out once and cached; whenever a
+    `Contains` relation comes or goes, the cache is dropped for the holder
+    and everything that (transitively) holds it.  So checking the player's
+    inventory for a crown is a dict lookup, however deep the crown is buried.
+    """
+    def __init__(self, registry):
+        self.registry = registry
+        self.relations = registry.relations
+        self._summaries = {}
+        self.relations.listeners.append(self._relation_changed)
+
+    def _relation_changed(self, relation, attached):
+        if not isinstance(relation, Contains):
+            return
+
+        # Forget about the holder and all of its holders in turn
+        incoming = self.relations._incoming
+        pending = [relation.from_id]
+        seen = set()
+        while pending:
+            holder_id = pending.pop()
+            if holder_id in seen:
+                continue
+            seen.add(holder_id)
+            self._summaries.pop(holder_id, None)
+            pending.extend(incoming.get(holder_id, _EMPTY).get(Contains, _EMPTY))
+
+    def _summarize(self, holder_id, visiting=frozenset()):
+        summary = self._summaries.get(holder_id)
+        if summary is not None:
+            return summary
+
+        # Guard against something ending up inside itself, which shouldn't
+        # happen but would otherwise recurse forever
+        visiting = visiting | {holder_id}
+        registry = self.registry
+        contents = []
+        ids = set()
+        counts = {}
+        children = self.relations._outgoing.get(holder_id, _EMPTY).get(
+            Contains, _EMPTY)
+        for child_id in children:
+            if child_id in visiting or child_id in ids:
+                continue
+            child = registry[child_id]
+            contents.append(child)
+            ids.add(child_id)
+            counts[child.type] = counts.get(child.type, 0) + 1
+
+            child_summary = self._summarize(child_id, visiting)
+            for entity in child_summary.contents:
+                if entity.id in ids:
+                    continue
+                contents.append(entity)
+                ids.add(entity.id)
+                counts[entity.type] = counts.get(entity.type, 0) + 1
+
+        summary = _ContentsSummary(tuple(contents), frozenset(ids), counts)
+        self._summaries[holder_id] = summary
+        return summary
+
+    def all_contents(self, holder):
+        """Return a tuple of everything inside `holder`, at any depth,
+        outermost first.
+        """
+        return self._summarize(holder.id).contents
+
+    def counts(self, holder):
+        """Return a dict of entity type => how many of that type are inside
+        `holder`, at any depth.  Don't modify it.
+        """
+        return self._summarize(holder.id).counts
+
+    def count(self, holder, entity_type):
+        return self._summarize(holder.id).counts.get(entity_type, 0)
+
+    def contains_transitively(self, holder, predicate):
+        """Return whether `holder` contains, at any depth, something matching
+        `predicate`.  That can be an entity type, a specific entity, or a
+        function that takes an entity and returns a bool.  The first two are
+        constant-time.
+        """
+        from flax.entity import Entity, EntityType
+
+        summary = self._summarize(holder.id)
+        if isinstance(predicate, EntityType):
+            return predicate in summary.counts
+        elif isinstance(predicate, Entity):
+            return (
+                predicate.registry is self.registry and
+                predicate.id in summary.ids)
+        else:
+            return any(predicate(entity) for entity in summary.contents)
 
 
 class RelationDescriptor:
@@ -163,12 +415,9 @@ class RelationDescriptor:
 
     def __get__(desc, self, cls):
         if self is None:
-            return cls
+            return desc
 
-        if desc.direction == 'subject':
-            return RelationProxy(self.entity, desc.relation, self.entity.relates_to[desc.relation])
-        elif desc.direction == 'object':
-            return RelationProxy(self.entity, desc.relation, self.entity.related_to[desc.relation])
+        return RelationProxy(self.entity, desc.relation, desc.direction)
 
 
 class RelationSubject(RelationDescriptor):
@@ -179,25 +428,46 @@ class RelationObject(RelationDescriptor):
 
 
 class RelationProxy:
-    def __init__(self, entity, relation, relation_set):
+    """The other ends of every relation of some type that an entity is part
+    of, in one direction.  Acts like a set of entities.
+    """
+    def __init__(self, entity, relation, direction):
         self.entity = entity
         self.relation = relation
-        self.relation_set = relation_set
+        self.direction = direction
+
+    def _index(self):
+        registry = self.entity.registry
+        if registry is None:
+            return _EMPTY
+        if self.direction == 'subject':
+            return registry.relations.objects(self.entity, self.relation)
+        else:
+            return registry.relations.subjects(self.relation, self.entity)
 
     def __bool__(self):
-        return bool(self.relation_set)
+        return bool(self._index())
+
+    def __len__(self):
+        return len(self._index())
+
+    def __iter__(self):
+        registry = self.entity.registry
+        for id in list(self._index()):
+            yield registry[id]
 
     def __contains__(self, entity):
-        # TODO this doesn't take direction into account
-        return any(entity is rel.from_entity for rel in self.relation_set)
+        return (
+            entity.registry is self.entity.registry and
+            entity.id in self._index())
 
     def add(self, entity):
-        # TODO this doesn't take direction into account
-        self.relation(entity, self.entity)
+        if self.direction == 'subject':
+            self.relation(self.entity, entity)
+        else:
+            self.relation(entity, self.entity)
 
     def remove(self, entity):
-        # TODO this doesn't take direction into account
-        # TODO also, super clunky
-        for rel in list(self.relation_set):
-            if rel.from_entity is entity:
-                rel.detach()
+        relation = self._index().get(entity.id)
+        if relation is not None:
+            relation.detach()
@@ -0,0 +1,226 @@
+"""Running the game headlessly, with no terminal and nobody at the keyboard.
+
+A `Simulation` builds a world and plays it out with a *policy* standing in for
+the player: something that's called with the world whenever the player needs
+to act, and returns an event (or None to stop).  It's the load-testing tool,
+and the thing to build other benchmarks on.
+
+Run with:
+
+    python -m flax sim --turns 1000
+
+and it'll report how long the world took to generate, and how many turns and
+events it got through per second.
+"""
+from collections import namedtuple
+import random
+import sys
+import time
+
+from flax.component import GameOver
+from flax.geometry import Direction
+
+
+DIRECTIONS = tuple(Direction)
+
+
+def random_policy(rng, *, eagerness=0.5):
+    """Wander around, but pick up anything lying underfoot and take any
+    stairs down.  With probability `eagerness`, each step heads for the
+    nearest stairs down instead of going somewhere random; otherwise the
+    player would potter about the first floor forever, which has nothing on
+    it to fight.  Not smart, but it gets around.
+    """
+    from collections import deque
+    from flax.component import PortalDownstairs, Solid
+    from flax.event import Descend, PickUp
+
+    # Map => {position: steps to the nearest stairs down}, worked out once
+    # per map; doors and monsters don't count as being in the way
+    distances = {}
+
+    def stairs_distances(map):
+        found = {}
+        queue = deque()
+        for position, tile in map.tiles.items():
+            if PortalDownstairs in tile.architecture:
+                found[position] = 0
+                queue.append(position)
+        while queue:
+            position = queue.popleft()
+            for direction in DIRECTIONS:
+                neighbor = position + direction
+                if (neighbor in found or neighbor not in map
+                        or Solid in map.tiles[neighbor].architecture):
+                    continue
+                found[neighbor] = found[position] + 1
+                queue.append(neighbor)
+        return found
+
+    def toward_stairs(world, position):
+        map = world.current_map
+        if map not in distances:
+            distances[map] = stairs_distances(map)
+        steps = distances[map]
+        here = steps.get(position)
+        if here is None:
+            return None
+        for direction in DIRECTIONS:
+            if steps.get(position + direction, here) < here:
+                return direction
+        return None
+
+    def choose(world):
+        tile = world.current_map.find(world.player)
+        items = tile.items
+        if items:
+            return PickUp(world.player, items[0])
+        if PortalDownstairs in tile.architecture:
+            return Descend(world.player)
+
+        if rng.random() < eagerness:
+            direction = toward_stairs(world, tile.position)
+            if direction is not None:
+                event = world.player_action_from_direction(direction)
+                if event is not None:
+                    return event
+
+        # Only fails off the edge of the map, so something has to work
+        while True:
+            event = world.player_action_from_direction(rng.choice(DIRECTIONS))
+            if event is not None:
+                return event
+
+    return choose
+
+
+def scripted_policy(steps):
+    """Follow a script: a sequence of direction names (``up``,
+    ``down_left``, ...), ``descend``, ``ascend``, or ``pickup``.  Steps that
+    don't make sense where the player is standing are skipped.  Stops when the
+    script runs out.
+    """
+    from flax.event import Ascend, Descend, PickUp
+
+    steps = iter(steps)
+
+    def choose(world):
+        for step in steps:
+            player = world.player
+            if step == 'descend':
+                return Descend(player)
+            elif step == 'ascend':
+                return Ascend(player)
+            elif step == 'pickup':
+                items = world.current_map.find(player).items
+                if items:
+                    return PickUp(player, items[0])
+            else:
+                try:
+                    direction = Direction[step]
+                except KeyError:
+                    raise ValueError("Unknown script step {!r}".format(step))
+                event = world.player_action_from_direction(direction)
+                if event is not None:
+                    return event
+        return None
+
+    return choose
+
+
+def starting_on(map_name, policy):
+    """Wrap `policy` so the player's first move is a `Teleport` to the named
+    map.  For starting somewhere more interesting than the first floor.
+    """
+    from flax.event import Teleport
+
+    started = False
+
+    def choose(world):
+        nonlocal started
+        if not started:
+            started = True
+            return Teleport(world.player, map_name)
+        return policy(world)
+
+    return choose
+
+
+SimResult = namedtuple(
+    'SimResult',
+    ['world', 'turns', 'actions', 'events', 'elapsed', 'generation_time',
+        'finished'])
+
+
+class Simulation:
+    """Plays out a world headlessly.  See the module docstring."""
+    def __init__(
+            self, seed=None, policy=None, *, pregenerate=False, start=None):
+        from flax.world import World
+
+        started = time.perf_counter()
+        self.world = World(seed=seed, pregenerate=pregenerate)
+        self.generation_time = time.perf_counter() - started
+
+        if policy is None:
+            policy = random_policy(random.Random(
+                '{}/sim'.format(self.world.seed)))
+        if start is not None:
+            # Goes through the journal like any other action, so a recording
+            # still replays
+            policy = starting_on(start, policy)
+        self.policy = policy
+
+    def run(self, turns):
+        """Play until `turns` more turns have passed, the policy runs out of
+        things to do, or the game ends.  Returns a `SimResult`.
+        """
+        world = self.world
+        goal = world.turn + turns
+        first_turn = world.turn
+        first_events = world.events_fired
+        actions = 0
+        finished = False
+
+        started = time.perf_counter()
+        try:
+            while world.turn < goal:
+                event = self.policy(world)
+                if event is None:
+                    break
+                world.push_player_action(event)
+                actions += 1
+                world.advance()
+        except GameOver:
+            finished = True
+        elapsed = time.perf_counter() - started
+
+        return SimResult(
+            world, world.turn - first_turn, actions,
+            world.events_fired - first_events, elapsed,
+            self.generation_time, finished)
+
+
+def report(result, file=sys.stdout):
+    def rate(n):
+        return n / result.elapsed if result.elapsed else 0
+
+    world = result.world
+    print("seed {}".format(world.seed), file=file)
+    print("{:<24} {:>9.1f} ms".format(
+        "world creation", result.generation_time * 1000), file=file)
+    for name, seconds in world.floor_plan.generation_times.items():
+        print("  {:<22} {:>9.1f} ms".format(name, seconds * 1000), file=file)
+    print("{:<24} {:>9.1f} ms".format(
+        "simulation", result.elapsed * 1000), file=file)
+    print("{:<24} {:>9} ({:.0f}/s)".format(
+        "turns", result.turns, rate(result.turns)), file=file)
+    print("{:<24} {:>9} ({:.0f}/s)".format(
+        "player actions", result.actions, rate(result.actions)), file=file)
+    print("{:<24} {:>9} ({:.0f}/s)".format(
+        "events fired", result.events, rate(result.events)), file=file)
+    if world.dropped_events:
+        print("{:<24} {:>9}".format(
+            "events dropped", sum(world.dropped_events.values())), file=file)
+    if result.finished:
+        print("game over: {}".format(world.obituary), file=file)
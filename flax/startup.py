@@ -0,0 +1,75 @@
+"""Startup profiling.  ``python -m flax --startup-profile`` goes through the
+same steps as launching the game -- importing everything, building the world,
+building the interface, and rendering the first frame -- but times each phase
+and prints a report instead of taking over the terminal.
+
+Deliberately imports nothing from flax at module level, so the imports can be
+timed too.
+"""
+import sys
+import time
+
+
+class StartupProfile:
+    def __init__(self):
+        self.phases = []
+
+    def phase(self, name, function):
+        """Call `function`, timing it as a top-level phase."""
+        started = time.perf_counter()
+        ret = function()
+        self.phases.append((name, time.perf_counter() - started, False))
+        return ret
+
+    def detail(self, name, seconds):
+        """Record part of the previous phase, which was timed elsewhere."""
+        self.phases.append((name, seconds, True))
+
+    def report(self, file=sys.stdout):
+        total = 0
+        for name, seconds, is_detail in self.phases:
+            if is_detail:
+                name = "  " + name
+            else:
+                total += seconds
+            print("{:<32} {:>9.1f} ms".format(name, seconds * 1000), file=file)
+        print("{:<32} {:>9.1f} ms".format("total", total * 1000), file=file)
+
+
+def _import(name):
+    __import__(name)
+    return sys.modules[name]
+
+
+def profile_startup(size=(80, 24)):
+    profile = StartupProfile()
+
+    profile.phase("import zope.interface", lambda: _import('zope.interface'))
+    profile.phase("import flax core", lambda: _import('flax.world'))
+    profile.phase("import urwid", lambda: _import('urwid'))
+    console = profile.phase(
+        "import flax.ui.console", lambda: _import('flax.ui.console'))
+
+    # Build the world the same way the game does, background map generation
+    # and all, or this isn't measuring what the player actually waits for
+    from flax.world import World
+    executor = console.map_executor()
+    world = profile.phase(
+        "World()", lambda: World(pregenerate=True, executor=executor))
+    try:
+        for name, seconds in world.floor_plan.generation_times.items():
+            profile.detail("generate {}".format(name), seconds)
+
+        widget = profile.phase(
+            "build widgets", lambda: console.FlaxWidget(world))
+
+        def render():
+            canvas = widget.render(size, focus=True)
+            # Canvases are lazy, so actually pull the content out
+            return list(canvas.content())
+        profile.phase("render first frame", render)
+    finally:
+        world.close()
+        executor.shutdown()
+
+    return profile
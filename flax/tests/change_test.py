@@ -0,0 +1,40 @@
+from flax.component import IBodied, ICombatant
+from flax.entity import Armor, EntityRegistry, Player, Salamango
+from flax.relation import Wearing
+
+
+def test_change_feed():
+    registry = EntityRegistry()
+    player = Player()
+    lizard = Salamango()
+    armor = Armor()
+    for entity in (player, lizard, armor):
+        registry.register(entity)
+
+    everything = []
+    player_health = []
+    registry.changes.subscribe(lambda *a: everything.append(a))
+    subscription = registry.changes.subscribe(
+        lambda *a: player_health.append(a),
+        entity=player,
+        attributes=[ICombatant['current_health'], Wearing])
+
+    ICombatant(lizard).current_health = 3
+    ICombatant(player).strength = 10
+    ICombatant(player).current_health = 3
+    IBodied(player).wearing.add(armor)
+    assert player_health == [
+        (player, ICombatant['current_health']),
+        (player, Wearing),
+    ]
+    assert everything == [
+        (lizard, ICombatant['current_health']),
+        (player, ICombatant['strength']),
+        (player, ICombatant['current_health']),
+        (player, Wearing),
+        (armor, Wearing),
+    ]
+
+    registry.changes.unsubscribe(subscription)
+    ICombatant(player).current_health = 2
+    assert len(player_health) == 2
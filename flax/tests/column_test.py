@@ -0,0 +1,70 @@
+from flax.component import ICombatant
+from flax.entity import Floor, Salamango
+from flax.geometry import Point, Size
+from flax.map import Map
+
+
+CURRENT = ICombatant['current_health']
+MAXIMUM = ICombatant['maximum_health']
+
+
+def test_columns_bind_and_unbind():
+    map = Map(Size(3, 1))
+    lizard = Salamango()
+    ICombatant(lizard).current_health = 4
+
+    map.place(lizard, Point(0, 0))
+    assert CURRENT not in lizard.component_data
+    assert ICombatant(lizard).current_health == 4
+    assert ICombatant(lizard).maximum_health == 5
+
+    # Writes go to the column, not the entity's own dict
+    ICombatant(lizard).current_health = 2
+    assert CURRENT not in lizard.component_data
+    assert ICombatant(lizard).current_health == 2
+
+    map.remove(lizard)
+    assert lizard.component_data[CURRENT] == 2
+    assert ICombatant(lizard).current_health == 2
+    # Only ever the type's default, so it doesn't get copied into the entity
+    assert MAXIMUM not in lizard.component_data
+    assert ICombatant(lizard).maximum_health == 5
+
+
+def test_columns_only_keep_values_written_while_bound():
+    map = Map(Size(1, 1))
+    lizard = Salamango()
+    map.place(lizard, Point(0, 0))
+    map.remove(lizard)
+    assert not lizard.component_data
+
+    map.place(lizard, Point(0, 0))
+    ICombatant(lizard).current_health = 3
+    map.remove(lizard)
+    assert lizard.component_data == {CURRENT: 3}
+
+
+def test_columns_skip_entities_without_columns():
+    map = Map(Size(1, 1))
+    floor = Floor()
+    map.place(floor, Point(0, 0))
+    assert floor._columns is None
+    assert len(map.columns) == 0
+
+
+def test_columns_select():
+    map = Map(Size(3, 1))
+    lizards = [Salamango() for _ in range(3)]
+    for x, lizard in enumerate(lizards):
+        map.place(lizard, Point(x, 0))
+    ICombatant(lizards[1]).current_health = 1
+
+    wounded = list(map.columns.select(
+        lambda cur, max: cur < max * 0.25, CURRENT, MAXIMUM))
+    assert wounded == [lizards[1]]
+
+    # Rows are recycled
+    map.remove(lizards[0])
+    map.place(lizards[0], Point(0, 0))
+    assert len(map.columns.entities) == 3
+    assert len(map.columns) == 3
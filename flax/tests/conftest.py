@@ -0,0 +1,22 @@
+import pytest
+
+
+@pytest.fixture
+def world():
+    """A world with a fixed seed, so every run gets the same maps."""
+    from flax.world import World
+    return World(seed=1)
+
+
+@pytest.fixture
+def place(world):
+    """Returns a function that puts an entity on the first tile of the
+    current map with no creature on it yet, and returns the entity.
+    """
+    def place(entity):
+        empty = next(
+            tile for tile in world.current_map.tiles.values()
+            if tile.creature is None)
+        world.current_map.place(entity, empty.position)
+        return entity
+    return place
@@ -0,0 +1,80 @@
+from flax.component import ICombatant
+from flax.entity import Floor, Salamango
+
+
+def test_entity_has_no_dict():
+    floor = Floor()
+    assert not hasattr(floor, '__dict__')
+
+
+def test_entity_storage_is_lazy():
+    floor = Floor()
+    assert floor._component_data is None
+
+    # Reading falls back to the type without allocating anything
+    lizard = Salamango()
+    assert ICombatant(lizard).current_health == 5
+    assert lizard._component_data is None
+
+    ICombatant(lizard).current_health = 3
+    assert ICombatant(lizard).current_health == 3
+    assert ICombatant(Salamango()).current_health == 5
+
+
+def test_entity_capabilities():
+    from flax.component import (
+        Component, IActor, IPhysics, IRender, Physics, Solid, Empty,
+        Combatant, Breakable, GenericAI)
+    lizard = Salamango()
+    for cap in (IPhysics, Physics, Solid, IRender, ICombatant, Combatant,
+                IActor, GenericAI):
+        assert cap in lizard
+        assert cap in Salamango
+    for cap in (Empty, Breakable, Component):
+        assert cap not in lizard
+
+    assert Empty in Floor()
+    assert Solid not in Floor()
+
+
+def test_init_plan_skips_components_without_init():
+    from flax.component import Breakable
+    from flax.entity import Rubble
+    plan = Salamango.init_plan()
+    assert plan == ()
+    assert Salamango.init_plan() is plan
+    assert Rubble.init_plan() == ((ICombatant, Breakable),)
+
+
+def test_create_many():
+    from flax.component import Breakable
+    from flax.entity import Rubble
+    lizards = Salamango.create_many(3)
+    assert len(lizards) == 3
+    assert len(set(map(id, lizards))) == 3
+
+    rubble = Rubble.create_many(2, initializers=(Breakable(0.5),))
+    assert [ICombatant(r).current_health for r in rubble] == [5, 5]
+
+
+def test_registry():
+    from flax.entity import EntityRegistry
+    registry = EntityRegistry()
+    a = Floor()
+    b = Floor()
+    assert a.id is None
+
+    assert registry.register(a) == 0
+    assert registry.register(b) == 1
+    assert registry.register(a) == 0
+    assert registry[1] is b
+    assert a in registry
+    assert a.registry is registry
+    assert len(registry) == 2
+
+    registry.release(a)
+    assert a not in registry
+    assert registry.get(0) is None
+    assert list(registry) == [b]
+    # Ids are never reused
+    assert registry.register(Floor()) == 2
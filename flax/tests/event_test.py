@@ -0,0 +1,148 @@
+from flax.component import Combatant, Physics, Solid
+from flax.entity import Floor, Salamango, Wall
+from flax.event import Event, Rulebook, Rule
+
+
+def test_rulebook_compiles_per_entity_type():
+    rulebook = Rulebook()
+    seen = []
+    rulebook.add(Rule(lambda event, c: seen.append(('physics', c)), Physics))
+    rulebook.add(Rule(lambda event, c: seen.append(('solid', c)), Solid))
+
+    assert len(rulebook.compile(Wall)) == 2
+    assert len(rulebook.compile(Floor)) == 1
+    assert rulebook.compile(Wall) is rulebook.compile(Wall)
+
+    wall = Wall()
+    rulebook.run(Event(), wall)
+    assert [name for name, _ in seen] == ['physics', 'solid']
+    assert all(type(c) is Solid and c.entity is wall for _, c in seen)
+
+    # Adding a rule throws the tables away
+    rulebook.add(Rule(lambda event, c: None, Combatant))
+    assert len(rulebook.compile(Wall)) == 2
+    assert len(rulebook.compile(Salamango)) == 3
+
+
+def test_profiler():
+    import json
+    import flax.event
+    from flax.event import Walk
+    from flax.geometry import Direction
+    from flax.world import World
+
+    world = World()
+    profiler = flax.event.start_profiling()
+    try:
+        for _ in range(3):
+            world.queue_event(Walk(world.player, Direction.up))
+            world.drain_event_queue()
+    finally:
+        assert flax.event.stop_profiling() is profiler
+    assert flax.event.current_profiler() is None
+
+    data = json.loads(profiler.to_json())
+    assert data['events']['Walk']['calls'] == 3
+    assert data['events']['Walk']['max_depth'] == 0
+    assert any(rule['rulebook'].startswith('Walk.') for rule in data['rules'])
+    assert 'Walk' in profiler.table()
+
+
+def test_stale_events_are_dropped(world, place):
+    from flax.event import Damage, MeleeAttack
+    from flax.geometry import Direction
+
+    lizard = place(Salamango())
+    world.queue_event(MeleeAttack(lizard, Direction.up))
+    world.queue_event(Damage(lizard, 1))
+    world.destroy_entity(lizard)
+    del lizard
+
+    world.drain_event_queue()
+    assert not world.event_queue
+    assert world.dropped_events == {'MeleeAttack': 1, 'Damage': 1}
+
+
+def test_computed_targets_are_cached():
+    from flax.event import Walk
+    from flax.geometry import Direction
+    from flax.world import World
+
+    world = World()
+    here = world.current_map.find(world.player)
+    # Pick a direction with room for two steps
+    direction = next(
+        d for d in Direction
+        if here.position + d + d in world.current_map)
+    walk = Walk(world.player, direction)
+    walk.world = world
+    tile = walk.target
+    assert walk.target is tile
+
+    # Moving the actor doesn't change where the event points...
+    world.current_map.move(world.player, tile.position)
+    assert walk.target is tile
+    # ...until asked
+    walk.retarget()
+    assert walk.target.position == tile.position + direction
+    world.current_map.move(world.player, here.position)
+
+
+def test_scheduled_events(world, place):
+    from flax.component import ICombatant
+    from flax.event import Damage
+
+    lizard = place(Salamango())
+    combatant = ICombatant(lizard)
+
+    world.schedule_recurring(3, lambda: Damage(lizard, 1), times=3)
+    world.schedule(2, Damage(lizard, 1))
+    world.cancel(world.schedule(1, Damage(lizard, 10)))
+    for _ in range(3):
+        world.turn += 1
+        world.fire_timers()
+    assert combatant.current_health == 5 - 2
+
+    for _ in range(10):
+        world.turn += 1
+        world.fire_timers()
+    assert combatant.current_health == 5 - 4
+    assert len(world.timers) == 0
+
+
+def test_coalescing_damage(world, place):
+    from flax.component import ICombatant
+    from flax.event import Damage, Die
+
+    world.coalesce_events = True
+    lizard = place(Salamango())
+
+    first = Damage(lizard, 1, source=world.player)
+    world.queue_event(first)
+    world.queue_event(Damage(lizard, 2))
+    world.queue_immediate_event(Damage(world.player, 1))
+    world.queue_event(Die(lizard))
+    world.queue_event(Die(lizard))
+    assert len(world.event_queue) == 3
+    assert first.amount == 3
+    assert first.sources == [(world.player, 1), (None, 2)]
+
+    world.drain_event_queue()
+    assert ICombatant(lizard).current_health == 5 - 3
+    assert lizard.released
+    assert not world._coalescible
+
+
+def test_events_stay_stale_after_reading_a_dead_participant():
+    import gc
+    from flax.event import Damage
+
+    lizard = Salamango()
+    event = Damage(lizard, 1)
+    del lizard
+    gc.collect()
+
+    # Reading the dead reference mustn't throw it away, or the event would
+    # look like it never had a target at all
+    assert event.target is None
+    assert event.is_stale()
@@ -0,0 +1,107 @@
+from flax.component import IActor, ICombatant, IPortable, Combatant
+from flax.entity import Floor, Player, Potion, Salamango
+from flax.geometry import Point, Size
+from flax.map import Map
+
+
+def make_map():
+    map = Map(Size(3, 1))
+    for x in range(3):
+        map.place(Floor(), Point(x, 0))
+    return map
+
+
+def test_query_backfills_and_tracks_membership():
+    map = make_map()
+    lizard = Salamango()
+    map.place(lizard, Point(0, 0))
+
+    actors = map.query(IActor)
+    assert list(actors) == [lizard]
+    assert map.query(IActor) is actors
+
+    # Entities placed later show up in existing queries...
+    player = Player()
+    map.place(player, Point(1, 0))
+    assert list(actors) == [lizard, player]
+    assert list(map.query(ICombatant, IActor)) == [lizard, player]
+
+    # ...and leave when removed
+    map.remove(lizard)
+    assert list(actors) == [player]
+    assert lizard not in actors
+    assert len(map.query(Combatant)) == 1
+
+
+def test_query_ignores_untracked_types():
+    map = make_map()
+    map.place(Potion(), Point(2, 0))
+    assert not map.query(IActor)
+    # Floors never matched a query, so they aren't indexed at all
+    assert map._archetypes[Floor] is None
+    assert len(map.query(IPortable)) == 1
+
+
+def test_pregenerated_maps_match():
+    from flax.world import World
+
+    plain = World(seed=7)
+    eager = World(seed=7, pregenerate=True)
+    try:
+        # The first floor's neighbor should be on its way already
+        assert 'map1' in eager.floor_plan._pending
+
+        expected = plain.floor_plan.get_map('map1')
+        actual = eager.floor_plan.get_map('map1')
+        assert actual.entity_positions == expected.entity_positions
+        assert not eager.floor_plan._pending
+    finally:
+        eager.close()
+
+
+def test_no_pregeneration_after_closing():
+    from concurrent.futures import ThreadPoolExecutor
+    from flax.world import World
+
+    executor = ThreadPoolExecutor(max_workers=1)
+    try:
+        world = World(seed=7, pregenerate=True, executor=executor)
+        world.close()
+        assert not world.floor_plan._pending
+
+        # Still works, but only in the foreground, and without starting up a
+        # pool nobody would ever shut down
+        world.change_map('map1')
+        assert not world.floor_plan._pending
+        assert world.floor_plan._executor is None
+    finally:
+        executor.shutdown()
+
+
+def describe_map(map):
+    from flax.component import IPortal
+    described = {}
+    for point, tile in map.tiles.items():
+        described[point] = [
+            (entity.id, entity.type,
+                IPortal(entity).destination if IPortal in entity else None)
+            for entity in tile.entities]
+    return described
+
+
+def test_generate_many_in_processes():
+    from flax.entity import EntityRegistry
+    from flax.fractor import MapSpec, RuinFractor, PerlinFractor
+    from flax.fractor import generate_many
+
+    specs = [
+        MapSpec(RuinFractor, Size(40, 20), down='below'),
+        MapSpec(PerlinFractor, Size(40, 20), up='above', down='below'),
+    ]
+    seeds = ['one', 'two']
+    expected = generate_many(
+        specs, seeds, workers=1, registry=EntityRegistry())
+    actual = generate_many(
+        specs, seeds, workers=2, registry=EntityRegistry())
+    for expected_map, actual_map in zip(expected, actual):
+        assert describe_map(actual_map) == describe_map(expected_map)
@@ -0,0 +1,177 @@
+import pytest
+
+from flax.component import IBodied, ICombatant, IEquipment
+from flax.entity import Armor, EntityRegistry, Player, Salamango
+from flax.relation import Relation, Wearing
+
+
+class Likes(Relation):
+    pass
+
+
+def make_entities(*types):
+    registry = EntityRegistry()
+    entities = [entity_type() for entity_type in types]
+    for entity in entities:
+        registry.register(entity)
+    return registry, entities
+
+
+def test_relation_indexes():
+    registry, (player, lizard, armor) = make_entities(Player, Salamango, Armor)
+    store = registry.relations
+
+    wearing = Wearing(player, armor)
+    likes = Likes(player, armor)
+    Likes(lizard, armor)
+    assert len(store) == 3
+
+    # Several relation types between the same pair
+    assert store.get(player, Wearing, armor) is wearing
+    assert store.get(player, Likes, armor) is likes
+    assert store.get(armor, Likes, player) is None
+
+    assert set(store.objects(player, Likes)) == {armor.id}
+    assert set(store.subjects(Likes, armor)) == {player.id, lizard.id}
+    assert set(store.outgoing(player)) == {wearing, likes}
+
+    likes.detach()
+    assert store.get(player, Likes, armor) is None
+    assert store.get(player, Wearing, armor) is wearing
+    assert len(store) == 2
+
+
+def test_relation_proxy_directions():
+    registry, (player, armor) = make_entities(Player, Armor)
+
+    IEquipment(armor).worn_by.add(player)
+    assert player in IEquipment(armor).worn_by
+    assert armor in IBodied(player).wearing
+    assert armor not in IEquipment(armor).worn_by
+    assert list(IBodied(player).wearing) == [armor]
+
+    IBodied(player).wearing.remove(armor)
+    assert not IBodied(player).wearing
+    assert not IEquipment(armor).worn_by
+
+
+def test_modifiers_follow_relations():
+    registry, (player, armor) = make_entities(Player, Armor)
+    assert ICombatant(player).strength == 3
+
+    IEquipment(armor).worn_by.add(player)
+    assert ICombatant(player).strength == 6
+
+    IEquipment(armor).worn_by.remove(player)
+    assert ICombatant(player).strength == 3
+
+
+def test_unregistered_entities_cannot_relate():
+    with pytest.raises(TypeError):
+        Wearing(Player(), Armor())
+
+
+def test_destroying_an_entity_destroys_its_relations():
+    from flax.world import World
+    world = World()
+    registry = world.entities
+    armor = Armor()
+    lizard = Salamango()
+    registry.register(armor)
+    registry.register(lizard)
+
+    IEquipment(armor).worn_by.add(world.player)
+    Likes(lizard, world.player)
+    Likes(world.player, lizard)
+    assert ICombatant(world.player).strength == 6
+
+    world.destroy_entity(armor)
+    assert armor not in registry
+    assert not IBodied(world.player).wearing
+    assert ICombatant(world.player).strength == 6 - 3
+
+    world.destroy_entity(lizard)
+    assert len(registry.relations) == 0
+    assert registry.relations._outgoing == {}
+    assert registry.relations._incoming == {}
+
+
+def test_containment_graph():
+    from flax.component import IContainer
+    from flax.entity import Crate, Crown, Key
+    registry, (player, crate, inner, crown, key) = make_entities(
+        Player, Crate, Crate, Crown, Key)
+    graph = registry.containment
+
+    IContainer(player).inventory.add(crate)
+    IContainer(crate).inventory.add(key)
+    assert not IContainer(player).has(Crown)
+    assert graph.count(player, Key) == 1
+
+    # Burying something deeper invalidates every holder up the chain
+    IContainer(inner).inventory.add(crown)
+    IContainer(crate).inventory.add(inner)
+    assert IContainer(player).has(Crown)
+    assert IContainer(player).has(crown)
+    assert list(IContainer(player).inventory) == [crate]
+    assert graph.all_contents(player) == (crate, key, inner, crown)
+    assert graph.counts(player) == {Crate: 2, Key: 1, Crown: 1}
+
+    IContainer(inner).inventory.remove(crown)
+    assert not IContainer(player).has(Crown)
+    assert IContainer(player).has(lambda item: item.isa(Key))
+    assert graph.count(crate, Crate) == 1
+
+
+def test_used_keys_and_dead_creatures_inventories_are_cleaned_up(
+        world, place):
+    from flax.component import IContainer, Lockable
+    from flax.entity import Door, Gem, Key
+    from flax.event import Die, Unlock
+
+    registry = world.entities
+    map = world.current_map
+
+    # Unlocking uses up the key for good
+    key = Key()
+    registry.register(key)
+    IContainer(world.player).inventory.add(key)
+    door = Door(Lockable(locked=True))
+    registry.register(door)
+    Unlock(world.player, door, key).fire(world)
+    assert key.released
+    assert not IContainer(world.player).inventory
+
+    # A dying creature drops what it was carrying
+    lizard = place(Salamango())
+    position = map.find(lizard).position
+    gem = Gem()
+    registry.register(gem)
+    IContainer(lizard).inventory.add(gem)
+    Die(lizard).fire(world)
+    assert lizard.released
+    assert not gem.released
+    assert gem in map.tiles[position].items
+
+
+def test_only_worn_equipment_modifies_stats(world):
+    from flax.component import ICombatant
+    from flax.entity import Armor
+    from flax.event import Equip, PickUp, Unequip
+
+    player = world.player
+    armor = Armor()
+    world.entities.register(armor)
+    world.current_map.place(armor, world.current_map.find(player).position)
+    base = ICombatant(player).strength
+
+    # Carrying it isn't enough
+    PickUp(player, armor).fire(world)
+    assert ICombatant(player).strength == base
+
+    # Wearing it counts once, even though it's still in the inventory too
+    Equip(player, armor).fire(world)
+    assert ICombatant(player).strength == base + 3
+
+    Unequip(player, armor).fire(world)
+    assert ICombatant(player).strength == base
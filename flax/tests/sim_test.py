@@ -0,0 +1,33 @@
+from flax.sim import Simulation, scripted_policy
+
+
+def test_simulation_runs_headlessly():
+    sim = Simulation(seed=2)
+    result = sim.run(200)
+    assert result.turns == 200
+    assert result.actions >= 200
+    assert not result.finished
+    # The player found the stairs, and met something that isn't just them
+    # walking around
+    assert result.world.floor_plan.current_map_name != 'map0'
+    assert result.events > result.actions
+
+    # Same seed, same game
+    again = Simulation(seed=2).run(200)
+    assert again.world.checksum() == result.world.checksum()
+
+
+def test_simulation_can_start_further_down():
+    # The stairs on this seed's first floor can't be reached on foot
+    sim = Simulation(seed=3, start='map1')
+    result = sim.run(100)
+    assert sim.world.floor_plan.current_map_name != 'map0'
+    assert result.events > result.actions
+
+
+def test_scripted_simulation_stops_when_script_does():
+    sim = Simulation(seed=3, policy=scripted_policy(['up', 'left', 'pickup']))
+    result = sim.run(100)
+    # The pickup doesn't count if there's nothing to pick up
+    assert result.actions in (2, 3)
+    assert result.turns == result.actions
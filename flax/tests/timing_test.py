@@ -0,0 +1,147 @@
+import random
+
+from flax.timing import ActorScheduler
+from flax.timing import TimingWheel
+
+
+def test_timing_wheel_matches_brute_force():
+    rng = random.Random(1234)
+    wheel = TimingWheel()
+    expected = {}
+    timers = []
+    for n in range(2000):
+        # Mix of near, far, and very far timers, to exercise every level
+        due = rng.choice([
+            rng.randrange(1, 64),
+            rng.randrange(1, 5000),
+            rng.randrange(1, 300000),
+        ])
+        timers.append(wheel.add(due, n))
+        expected.setdefault(due, []).append(n)
+    assert len(wheel) == 2000
+
+    # Cancel a few
+    for timer in rng.sample(timers, 100):
+        wheel.cancel(timer)
+        expected[timer.due].remove(timer.payload)
+    assert len(wheel) == 1900
+
+    now = 0
+    while len(wheel):
+        step = rng.randrange(1, 700)
+        fired = [timer.payload for timer in wheel.advance(now + step)]
+        want = []
+        for turn in range(now + 1, now + step + 1):
+            want.extend(expected.pop(turn, ()))
+        assert fired == want
+        now += step
+    assert not any(expected.values())
+
+
+def test_recurring_timers():
+    wheel = TimingWheel()
+    poison = wheel.add(3, 'poison', interval=3, times=4)
+    forever = wheel.add(10, 'tick', interval=100)
+
+    fired = [(wheel.now, timer.payload) for timer in wheel.advance(20)]
+    assert fired == [
+        (3, 'poison'), (6, 'poison'), (9, 'poison'), (10, 'tick'),
+        (12, 'poison')]
+    assert not poison.active
+
+    assert [wheel.now for timer in wheel.advance(1000)] == [
+        110 + 100 * n for n in range(9)]
+    wheel.cancel(forever)
+    assert len(wheel) == 0
+    assert list(wheel.advance(5000)) == []
+
+    # Adding something for a turn that's already gone means next turn
+    late = wheel.add(3, 'late')
+    assert late.due == 5001
+
+
+class FakeEntity:
+    def __init__(self, id):
+        self.id = id
+
+
+def test_actor_scheduler_order():
+    scheduler = ActorScheduler()
+    a, b, c = FakeEntity(1), FakeEntity(2), FakeEntity(3)
+    scheduler.schedule(a, 100)
+    scheduler.schedule(b, 50)
+    scheduler.schedule(c, 100)
+    # Rescheduling replaces the old entry
+    scheduler.schedule(b, 150)
+    assert len(scheduler) == 3
+    assert scheduler.when(b) == 150
+
+    assert scheduler.pop() is a
+    assert scheduler.now == 100
+    scheduler.discard(c)
+    assert c not in scheduler
+    assert scheduler.pop() is b
+    assert scheduler.peek() == (None, None)
+
+
+def test_fast_and_slow_actors(world, place):
+    from flax.component import Actor, IActor
+    from flax.entity import Creature
+    from flax.event import Event
+
+    acted = []
+
+    class Counter(Actor):
+        def act(self, world):
+            acted.append(self.entity.type.name)
+
+    Fast = Creature(Counter(speed=200), name='fast')
+    Slow = Creature(Counter(speed=50), name='slow')
+
+    # Keep it to just our two; the player stands still
+    for entity in list(world.query(IActor)):
+        if entity is not world.player:
+            world.destroy_entity(entity)
+    for entity_type in (Fast, Slow):
+        entity = place(entity_type())
+        world.actors.schedule(entity, world.actors.now)
+
+    for _ in range(4):
+        world.push_player_action(Event())
+        world.advance()
+
+    # Four turns is 400 ticks.  Both go at 0; the slow one also gets in at
+    # 400, since it was scheduled for then before the player was
+    assert world.turn == 4
+    assert acted.count('fast') == 8
+    assert acted.count('slow') == 3
+
+
+def test_very_fast_actors_still_let_time_pass(world, place):
+    from flax.component import Actor, IActor
+    from flax.entity import Creature
+    from flax.event import Event
+    from flax.timing import TICKS_PER_TURN, action_delay
+
+    assert action_delay(10 ** 6) == 1
+
+    acted = []
+
+    class Counter(Actor):
+        def act(self, world):
+            acted.append(world.turn)
+
+    Blur = Creature(Counter(speed=10 ** 6), name='blur')
+    for entity in list(world.query(IActor)):
+        if entity is not world.player:
+            world.destroy_entity(entity)
+    entity = place(Blur())
+    world.actors.schedule(entity, world.actors.now)
+
+    # Used to reschedule itself for the same tick forever
+    for _ in range(2):
+        world.push_player_action(Event())
+        world.advance()
+    assert world.turn == 2
+    # As fast as it gets: once a tick
+    assert len(acted) <= 2 * TICKS_PER_TURN + 1
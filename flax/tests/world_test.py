@@ -0,0 +1,138 @@
+from flax.component import IActor, ICombatant
+from flax.timing import NORMAL_SPEED
+from flax.world import World
+
+
+def test_catch_up_after_leaving_a_map():
+    world = World(seed=5)
+    world.change_map('map1')
+    map1 = world.current_map
+    monsters = [
+        actor for actor in map1.query(IActor) if actor is not world.player]
+    assert monsters
+    ICombatant(monsters[0]).current_health = 1
+    positions = {
+        monster: map1.find(monster).position for monster in monsters}
+
+    world.change_map('map0')
+    assert map1.left_turn == world.turn
+    world.turn += 10000
+
+    # Ten thousand turns away, but only catch_up_turns' worth of steps are
+    # taken.  Every move bumps the map's version, so count those (less one
+    # for the player arriving)
+    version = map1.version
+    world.change_map('map1')
+    assert map1.left_turn is None
+    moves = map1.version - version - 1
+    most_steps = sum(
+        world.catch_up_turns * IActor(monster).speed // NORMAL_SPEED
+        for monster in monsters)
+    assert 0 < moves <= most_steps
+
+    combatant = ICombatant(monsters[0])
+    assert combatant.current_health == combatant.maximum_health
+    for monster, old_position in positions.items():
+        new_position = map1.find(monster).position
+        assert abs(new_position.x - old_position.x) <= world.catch_up_turns
+        assert abs(new_position.y - old_position.y) <= world.catch_up_turns
+    assert any(
+        map1.find(monster).position != positions[monster]
+        for monster in monsters)
+
+
+def test_regeneration_matches_catch_up():
+    from flax.event import Event
+
+    def wounded_world():
+        world = World(seed=5)
+        world.change_map('map1')
+        monster = next(
+            actor for actor in world.current_map.query(IActor)
+            if actor is not world.player)
+        ICombatant(monster).current_health = 1
+        return world, ICombatant(monster)
+
+    # Live: the monster heals a point every heal_interval turns
+    world, combatant = wounded_world()
+    while world.turn < world.heal_interval * 3 + 5:
+        world.push_player_action(Event())
+        world.advance()
+    live = combatant.current_health
+    assert live == min(combatant.maximum_health, 1 + 3)
+
+    # Away for the same turns: the same healing, all at once
+    world, combatant = wounded_world()
+    world.change_map('map0')
+    world.turn += world.heal_interval * 3 + 5
+    world.change_map('map1')
+    assert combatant.current_health == live
+
+
+def test_advance_in_slices():
+    from flax.event import Event
+
+    world = World(seed=5)
+    world.change_map('map1')
+    actors = len(list(world.query(IActor)))
+
+    # With no time at all, every actor gets a slice to themselves
+    world.push_player_action(Event())
+    slices = 1
+    while not world.advance(budget=0):
+        slices += 1
+    assert slices == actors + 1
+    assert world.turn == 1
+
+
+def test_destroying_an_entity_on_another_map():
+    from flax.event import Damage
+
+    world = World(seed=5)
+    world.change_map('map1')
+    map1 = world.current_map
+    monster = next(
+        actor for actor in map1.query(IActor) if actor is not world.player)
+    world.change_map('map0')
+
+    # Something left behind finishes it off while the player's away
+    world.schedule(1, Damage(monster, 100))
+    world.turn += 1
+    world.fire_timers()
+
+    assert monster.released
+    assert monster.id not in map1.entity_positions
+    assert monster not in list(map1.query(IActor))
+    assert all(
+        monster not in tile.entities for tile in map1.tiles.values())
+
+    world.change_map('map1')
+    assert monster not in world.actors
+
+
+def test_actors_placed_during_play_get_to_act(world, place):
+    from flax.component import Actor
+    from flax.entity import Creature
+    from flax.event import Event
+
+    acted = []
+
+    class Counter(Actor):
+        def act(self, world):
+            acted.append(world.turn)
+
+    newcomer = place(Creature(Counter(), name='newcomer')())
+    assert newcomer in world.actors
+
+    for _ in range(3):
+        world.push_player_action(Event())
+        world.advance()
+    assert acted
+
+    # Only the current map's newcomers, though
+    map0 = world.current_map
+    world.change_map('map1')
+    position = map0.find(newcomer).position
+    map0.remove(newcomer)
+    map0.place(newcomer, position)
+    assert newcomer not in world.actors
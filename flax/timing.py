@@ -0,0 +1,250 @@
+"""Scheduling things to happen on future turns.
+
+`World.event_queue` only holds what's happening right now.  Anything that
+wants to happen later -- a door swinging shut in 20 turns, poison that bites
+every 3 turns -- goes in a `TimingWheel` instead.
+
+The wheel is hierarchical, like a clock: the bottom level has a slot for each
+of the next 64 turns; the next level up has a slot for each of the next 64
+blocks of 64 turns; and so on.  A timer goes in the coarsest slot that still
+tells it apart from the current turn, and whenever the turn rolls over into a
+new block, that block's slot is emptied back into the finer levels.  So adding,
+cancelling, and finding what's due are all constant time per timer, no matter
+how many are waiting.
+
+Actors get their own, finer-grained clock; see `ActorScheduler`.
+"""
+import heapq
+import itertools
+
+SLOT_BITS = 6
+SLOTS = 1 << SLOT_BITS
+SLOT_MASK = SLOTS - 1
+# Four levels covers 64 ** 4, or about 16 million turns, which ought to be
+# plenty; anything past that waits in an overflow pile
+LEVELS = 4
+
+
+class Timer:
+    """Something scheduled in a `TimingWheel`.  Returned from `add`, mostly so
+    it can be cancelled later.
+    """
+    __slots__ = ('due', 'payload', 'interval', 'remaining', 'cancelled', '_slot')
+
+    def __init__(self, due, payload, interval=None, remaining=None):
+        self.due = due
+        self.payload = payload
+        # For recurring timers: turns between firings, and how many more times
+        # to fire (None for forever)
+        self.interval = interval
+        self.remaining = remaining
+        self.cancelled = False
+        self._slot = None
+
+    def __repr__(self):
+        return "<{} due {}: {!r}>".format(
+            type(self).__qualname__, self.due, self.payload)
+
+    @property
+    def active(self):
+        return self._slot is not None
+
+
+class TimingWheel:
+    """A pile of timers, sorted into slots by when they're due.  See the
+    module docstring.
+    """
+    def __init__(self, now=0):
+        self.now = now
+        # Each slot is a dict used as an ordered set, so timers due on the same
+        # turn fire in the order they were added
+        self.levels = [[{} for _ in range(SLOTS)] for _ in range(LEVELS)]
+        self.overflow = {}
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def add(self, due, payload, *, interval=None, times=None):
+        """Schedule `payload` for turn `due` (or the next turn, if that's
+        already passed), and return the `Timer`.  If
+        `interval` is given, the timer comes back every `interval` turns
+        after that, `times` times in total (or forever).
+        """
+        if interval is not None and interval < 1:
+            raise ValueError("Interval must be at least one turn")
+        if times is not None and times < 1:
+            raise ValueError("Can't schedule something to happen zero times")
+
+        # Anything due now or earlier has missed this turn; do it next turn
+        timer = Timer(max(due, self.now + 1), payload, interval, times)
+        self._insert(timer)
+        self._count += 1
+        return timer
+
+    def cancel(self, timer):
+        """Stop a timer from firing.  Harmless if it's already fired or been
+        cancelled.
+        """
+        timer.cancelled = True
+        if timer._slot is not None:
+            del timer._slot[timer]
+            timer._slot = None
+            self._count -= 1
+
+    def _insert(self, timer):
+        due = timer.due
+        delta = due - self.now
+        for level in range(LEVELS):
+            if delta < 1 << (SLOT_BITS * (level + 1)):
+                slot = self.levels[level][(due >> (SLOT_BITS * level)) & SLOT_MASK]
+                break
+        else:
+            slot = self.overflow
+
+        slot[timer] = None
+        timer._slot = slot
+
+    def _cascade(self, level):
+        """Empty out the slot at `level` that the current turn just rolled
+        into, refiling its timers into finer levels.  Returns that slot's
+        index.
+        """
+        if level == LEVELS:
+            slot = self.overflow
+            self.overflow = {}
+            index = 0
+        else:
+            index = (self.now >> (SLOT_BITS * level)) & SLOT_MASK
+            slot = self.levels[level][index]
+            self.levels[level][index] = {}
+
+        for timer in slot:
+            self._insert(timer)
+        return index
+
+    def advance(self, now):
+        """Move the clock forward to turn `now`, one turn at a time, and yield
+        every timer that comes due along the way.
+
+        Recurring timers are rescheduled before they're yielded, so they can
+        be cancelled by whoever handles them.
+        """
+        while self.now < now:
+            self.now += 1
+            level = 1
+            if self.now & SLOT_MASK == 0:
+                while level <= LEVELS and self._cascade(level) == 0:
+                    level += 1
+
+            index = self.now & SLOT_MASK
+            due = self.levels[0][index]
+            if not due:
+                continue
+            self.levels[0][index] = {}
+
+            for timer in due:
+                timer._slot = None
+                self._count -= 1
+                if timer.interval is not None:
+                    if timer.remaining is not None:
+                        timer.remaining -= 1
+                    if timer.remaining is None or timer.remaining > 0:
+                        timer.due = self.now + timer.interval
+                        self._insert(timer)
+                        self._count += 1
+
+            for timer in due:
+                # Handling an earlier timer may have cancelled this one
+                if not timer.cancelled:
+                    yield timer
+
+
+# Actors measure time in ticks, so that some of them can act more often than
+# once a turn.  An actor with normal speed acts once every turn.
+TICKS_PER_TURN = 100
+NORMAL_SPEED = 100
+
+
+def action_delay(speed):
+    """How many ticks an actor with the given speed has to wait between
+    actions.  Always at least one, however fast the actor is; otherwise it'd
+    act forever without time ever moving on.
+    """
+    return max(1, TICKS_PER_TURN * NORMAL_SPEED // speed)
+
+
+class ActorScheduler:
+    """Decides whose go it is.
+
+    Every actor has a time, in ticks, when it next gets to act.  They're kept
+    in a heap, so finding the next actor and putting it back afterwards are
+    O(log actors), and fast and slow actors just come up more or less often.
+    Actors due at the same time go in the order they were scheduled.
+    """
+    def __init__(self, now=0):
+        self.now = now
+        # Heap of [time, sequence number, entity].  Rescheduling or removing
+        # an actor doesn't dig through the heap; it just blanks out the old
+        # entry's entity, and blank entries are thrown away when they reach
+        # the top
+        self._heap = []
+        # Entity id => that entity's live heap entry
+        self._entries = {}
+        self._sequence = itertools.count()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, entity):
+        return entity.id in self._entries
+
+    def when(self, entity):
+        """Return the time the entity is due to act, or None if it's not
+        scheduled.
+        """
+        entry = self._entries.get(entity.id)
+        if entry is None:
+            return None
+        return entry[0]
+
+    def schedule(self, entity, time):
+        """Have the entity act at the given time (or now, if that's already
+        passed), replacing whenever it was going to act before.
+        """
+        self.discard(entity)
+        entry = [max(time, self.now), next(self._sequence), entity]
+        self._entries[entity.id] = entry
+        heapq.heappush(self._heap, entry)
+
+    def discard(self, entity):
+        entry = self._entries.pop(entity.id, None)
+        if entry is not None:
+            entry[2] = None
+
+    def clear(self):
+        self._heap.clear()
+        self._entries.clear()
+
+    def peek(self):
+        """Return ``(time, entity)`` for whoever acts next, or ``(None,
+        None)`` if nobody's left.
+        """
+        heap = self._heap
+        while heap and heap[0][2] is None:
+            heapq.heappop(heap)
+        if not heap:
+            return None, None
+        return heap[0][0], heap[0][2]
+
+    def pop(self):
+        """Take whoever acts next off the schedule, move the clock up to their
+        time, and return them.
+        """
+        time, entity = self.peek()
+        if entity is None:
+            raise IndexError("Nobody is scheduled to act")
+        heapq.heappop(self._heap)
+        del self._entries[entity.id]
+        self.now = time
+        return entity
@@ -1,12 +1,12 @@
 import logging
 import sys
 
-import urwid
-
 from flax.component import GameOver
 from flax.world import World
 from .game import FlaxWidget
 from .game import PALETTE
+from .runtime import Runtime
+from .runtime import map_executor
 
 
 LEVEL_STDOUT = logging.INFO - 1
@@ -23,13 +23,18 @@ class LogWidgetHandler(logging.Handler):
         self._widget.add_log_line(msg)
 
 
-def main():
-    # Build the interface
-    world = World()
+def main(seed=None, record=None):
+    # Build the interface.  Upcoming floors get built in the background, in
+    # another process, while the player is busy reading and thinking
+    executor = map_executor()
+    world = World(seed=seed, pregenerate=True, executor=executor)
+    if record:
+        from flax.journal import JournalWriter
+        world.journal = JournalWriter.open(record, world.seed)
     widget = FlaxWidget(world)
-    loop = urwid.MainLoop(widget, PALETTE)
+    runtime = Runtime(widget, PALETTE)
     # TODO upstream detection for these?
-    loop.screen.set_terminal_properties(
+    runtime.urwid_loop.screen.set_terminal_properties(
         colors=256,
         bright_is_bold=False,
     )
@@ -43,7 +48,7 @@ def main():
     flax_logger.propagate = False
 
     try:
-        loop.run()
+        runtime.run()
     except Exception:
         # TODO need to clean up console even for an arbitrary exception?  maybe
         # if i use `with loop.start():`?  i'm surprised run() doesn't clean
@@ -54,6 +59,9 @@ def main():
         sys.stdout.flush()
         sys.stderr.flush()
         raise
+    finally:
+        world.close()
+        executor.shutdown()
 
     # If the world captured an explicit end-of-game, print the message before
     # dying entirely.
@@ -391,8 +391,15 @@ class WizardPrompt(urwid.WidgetWrap):
 
 
 class FlaxWidget(urwid.WidgetWrap):
+    # Seconds the world gets to run before the screen is redrawn and input is
+    # handled, when a turn takes a while
+    turn_budget = 0.05
+
     def __init__(self, world):
         self.world = world
+        # The asyncio `Runtime`, if any, which runs the world in slices; see
+        # `request_advance`
+        self.runtime = None
 
         self.world_widget = CellWidget(world)
         self.status_widget = PlayerStatusWidget(world.player)
@@ -426,6 +433,68 @@ class FlaxWidget(urwid.WidgetWrap):
 
         super().__init__(self.overlay)
 
+        # Only redraw the parts of the screen that might have changed: the
+        # status pane when something about the player changes, including what
+        # they're wearing; the map and tile pane when the map changes or any
+        # entity's data does (doors opening, rubble breaking, etc.)
+        self.status_dirty = False
+        self.map_dirty = False
+        self.seen_map = self.world.current_map
+        self.seen_map_version = self.seen_map.version
+        changes = self.world.entities.changes
+        changes.subscribe(self._player_changed, entity=self.world.player)
+        changes.subscribe(self._anything_changed)
+
+    def _player_changed(self, entity, attribute):
+        self.status_dirty = True
+
+    def _anything_changed(self, entity, attribute):
+        self.map_dirty = True
+
+    def refresh(self):
+        """Redraw whichever widgets are out of date."""
+        map = self.world.current_map
+        if map is not self.seen_map or map.version != self.seen_map_version:
+            self.seen_map = map
+            self.seen_map_version = map.version
+            self.map_dirty = True
+
+        if self.map_dirty:
+            self.map_dirty = False
+            self.tile_widget.update_from_tile(map.find(self.world.player))
+            self.world_widget._invalidate()
+
+        if self.status_dirty:
+            self.status_dirty = False
+            self.status_widget.update()
+
+    def profile_command(self, args):
+        """Wizard command for the event profiler: ``profile on``, ``profile
+        off``, ``profile dump`` to log a summary, or ``profile dump FILE`` to
+        write the whole thing out as JSON.
+        """
+        import flax.event
+        action = args[0] if args else 'dump'
+        if action == 'on':
+            flax.event.start_profiling()
+            log.info("Profiling events.")
+        elif action == 'off':
+            flax.event.stop_profiling()
+            log.info("Stopped profiling events.")
+        elif action == 'dump':
+            profiler = flax.event.current_profiler()
+            if profiler is None:
+                log.info("Not profiling; try 'profile on'.")
+            elif len(args) > 1:
+                with open(args[1], 'w') as f:
+                    f.write(profiler.to_json(indent=2))
+                log.info("Wrote profile to {}.".format(args[1]))
+            else:
+                for line in profiler.table(limit=5).splitlines():
+                    log.info(line)
+        else:
+            log.info("Usage: profile on|off|dump [file]")
+
     def keypress(self, size, key):
         # Let WidgetWrap pass the keypress to the wrapped overlay first
         key = super().keypress(size, key)
@@ -445,10 +514,11 @@ class FlaxWidget(urwid.WidgetWrap):
             # getting the value back bothers me a bit here.  maybe command
             # actions should become functions, which can optionally `yield`...
             def wizard(command=None):
-                if not command:
+                words = command.split() if command else []
+                if not words:
                     return
 
-                if command == 'down':
+                if words[0] == 'down':
                     import random
                     from flax.component import PortalDownstairs
                     maps = []
@@ -458,8 +528,15 @@ class FlaxWidget(urwid.WidgetWrap):
                     if not maps:
                         log.info("No down stairs here.")
                         return
+                    # Goes through the player's queue like any other action,
+                    # so it ends up in the journal and replays the same
+                    from flax.event import Teleport
                     new_map = random.choice(maps)
-                    self.world.change_map(new_map)
+                    self.world.push_player_action(
+                        Teleport(self.world.player, new_map))
+                    self.request_advance()
+                elif words[0] == 'profile':
+                    self.profile_command(words[1:])
                 else:
                     log.info("'{}' is not a wizard spell.".format(command))
             self.overlay.change_overlay(WizardPrompt(), onclose=wizard)
@@ -512,11 +589,10 @@ class FlaxWidget(urwid.WidgetWrap):
         elif key == 'r':
             # TODO menu prompt plz; identifying items is gonna be pretty
             # important later
-            from flax.relation import Wearing
-            rels = self.world.player.relates_to[Wearing]
-            if rels:
-                rel = next(iter(rels))
-                event = Unequip(self.world.player, rel.to_entity)
+            from flax.component import IBodied
+            wearing = IBodied(self.world.player).wearing
+            if wearing:
+                event = Unequip(self.world.player, next(iter(wearing)))
             else:
                 pass
         else:
@@ -527,7 +603,17 @@ class FlaxWidget(urwid.WidgetWrap):
 
         # TODO um, shouldn't really advance the world if the player pressed a
         # bogus key
-        # TODO should probably use the event loop?  right?
+        self.request_advance()
+
+    def request_advance(self):
+        """The player has done something, so the world should get on with
+        it.  Under a `Runtime`, that happens a slice at a time in the
+        background; without one, it all happens right here.
+        """
+        if self.runtime is not None:
+            self.runtime.wake()
+            return
+
         try:
             self.world.advance()
         except GameOver:
@@ -535,11 +621,4 @@ class FlaxWidget(urwid.WidgetWrap):
             # GameOver into a main loop exit?  (consider that eventually a game
             # end should be handled by the UI, not by crashing and burning.)
             raise urwid.ExitMainLoop
-
-
-        # TODO unclear when the right time to update this is
-        self.tile_widget.update_from_tile(
-            self.world.current_map.find(self.world.player))
-
-        self.status_widget.update()
-        self.world_widget._invalidate()
+        self.refresh()
@@ -0,0 +1,130 @@
+"""Runs the console game on asyncio.
+
+urwid's own loop only knows about input and alarms, so everything else had to
+happen inside a keypress.  Here, urwid runs on top of an asyncio event loop
+instead, and the game is a handful of tasks sharing it:
+
+- urwid itself, reading input and drawing the screen;
+- the world, which wakes up when the player does something and runs in
+  slices, redrawing in between (see `World.advance`);
+- autosaving, which every so often makes sure the journal is really on disk;
+- map pregeneration, which runs in a separate process, so it doesn't fight
+  the rest of the game for the GIL.
+
+Anything slow or blocking goes through an executor, so the screen and the
+keyboard never have to wait for it.
+"""
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+
+import urwid
+
+from flax.component import GameOver
+from flax.event import Ascend, Descend
+
+
+class Runtime:
+    # Seconds between journal syncs
+    autosave_interval = 10
+
+    def __init__(self, widget, palette):
+        self.widget = widget
+        self.world = widget.world
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.urwid_loop = urwid.MainLoop(
+            widget, palette,
+            event_loop=urwid.AsyncioEventLoop(loop=self.loop))
+        widget.runtime = self
+
+        # Set when the player has done something the world should deal with
+        self.wakeup = asyncio.Event()
+        self.tasks = []
+
+    def wake(self):
+        self.wakeup.set()
+
+    def run(self):
+        self.tasks = [
+            self.loop.create_task(self.run_world()),
+            self.loop.create_task(self.autosave()),
+        ]
+        for task in self.tasks:
+            task.add_done_callback(self._task_done)
+
+        try:
+            self.urwid_loop.run()
+        finally:
+            for task in self.tasks:
+                task.cancel()
+            # Let the cancellations actually happen
+            self.loop.run_until_complete(
+                asyncio.gather(*self.tasks, return_exceptions=True))
+            self.loop.close()
+
+    def _task_done(self, task):
+        if task.cancelled():
+            return
+        exc = task.exception()
+        if exc is not None:
+            # Tasks keep their exceptions to themselves, so pass it along to
+            # urwid, which will stop the loop (quietly, if it's ExitMainLoop)
+            raise exc
+
+    def stop(self):
+        def exit():
+            raise urwid.ExitMainLoop
+        self.loop.call_soon(exit)
+
+    async def run_world(self):
+        world = self.world
+        widget = self.widget
+        while True:
+            await self.wakeup.wait()
+            self.wakeup.clear()
+
+            finished = False
+            while not finished:
+                await self.wait_for_maps()
+                try:
+                    finished = world.advance(budget=widget.turn_budget)
+                except GameOver:
+                    # TODO see the similar comment in FlaxWidget
+                    self.stop()
+                    return
+
+                widget.refresh()
+                # This isn't one of urwid's own callbacks, so it won't redraw
+                # on its own
+                self.urwid_loop.draw_screen()
+                # Give input a chance before the next slice
+                await asyncio.sleep(0)
+
+    async def wait_for_maps(self):
+        """If the player's about to take the stairs, wait (without blocking)
+        for any maps still being generated in the background; otherwise the
+        world would just sit there blocking on them.
+        """
+        if not any(
+                isinstance(event, (Descend, Ascend))
+                for event in self.world.player_action_queue):
+            return
+
+        futures = self.world.floor_plan.pending_futures()
+        if futures:
+            await asyncio.wait([asyncio.wrap_future(f) for f in futures])
+
+    async def autosave(self):
+        while True:
+            await asyncio.sleep(self.autosave_interval)
+            journal = self.world.journal
+            if journal is not None:
+                # Waiting on the disk can take a while
+                await self.loop.run_in_executor(None, journal.sync)
+
+
+def map_executor():
+    """Return an executor for generating maps in the background: a single
+    worker process, which is as far ahead as the game ever needs to get.
+    """
+    return ProcessPoolExecutor(max_workers=1)
@@ -0,0 +1,56 @@
+"""Odds and ends that don't belong anywhere in particular."""
+import weakref
+
+
+class WeakProperty:
+    """Descriptor that automatically holds onto whatever it contains as a weak
+    reference.  Reading this attribute will never raise `AttributeError`; if
+    the reference is broken or missing, you'll just get `None`.
+
+    The actual weak reference is stored in the object's `__dict__` under the
+    given name, so this acts as sort of a transparent proxy that lets you
+    forget you're dealing with weakrefs at all.
+
+    Assigning `None` just clears it.  If you try to assign anything else that
+    can't be weak referenced, you'll get a `TypeError`.  So don't do that.
+
+    Example:
+
+        class Foo:
+            bar = WeakProperty('bar')
+
+        obj = object()
+        foo = Foo()
+        foo.bar = obj
+        print(foo.bar)  # <object object at ...>
+        assert foo.bar is obj
+        del obj
+        print(foo.bar)  # None
+
+    Note that due to the `__dict__` twiddling, this descriptor will never
+    trigger `__getattr__`, `__setattr__`, or `__delattr__`.
+    """
+    def __init__(self, name):
+        self.name = name
+
+    def __get__(desc, self, cls):
+        if self is None:
+            return desc
+
+        try:
+            ref = self.__dict__[desc.name]
+        except KeyError:
+            return None
+        else:
+            # Note that a dead weakref is left in place, so it's still possible
+            # to tell "was never set" apart from "has since died"
+            return ref()
+
+    def __set__(desc, self, value):
+        if value is None:
+            self.__dict__.pop(desc.name, None)
+        else:
+            self.__dict__[desc.name] = weakref.ref(value)
+
+    def __delete__(desc, self):
+        del self.__dict__[desc.name]
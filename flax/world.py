@@ -1,21 +1,56 @@
+from collections import Counter
 from collections import deque
+import logging
+import random
+import struct
+import time
+import zlib
 
 from flax.component import IActor, IPhysics, IContainer, IOpenable, ILockable
 from flax.component import GameOver
+from flax.entity import EntityRegistry
 from flax.entity import Key
 from flax.entity import Player
 from flax.fractor import BinaryPartitionFractor
+from flax.fractor import MapCanvas
+from flax.fractor import MapSpec
 from flax.fractor import PerlinFractor
 from flax.fractor import RuinFractor
 from flax.fractor import RuinedHallFractor
+from flax.fractor import generate_compact
+from flax.fractor import generate_many
 from flax.geometry import Size
+from flax.relation import DestroyRelationEvent
+from flax.timing import ActorScheduler
+from flax.timing import TimingWheel
+from flax.timing import NORMAL_SPEED
+from flax.timing import TICKS_PER_TURN
+from flax.timing import action_delay
+
+
+log = logging.getLogger(__name__)
 
 
 class FloorPlan:
     """Arrangement of the maps themselves."""
     # Will also take care of saving and loading later, maybe?
-    def __init__(self, player):
+    def __init__(
+            self, player, registry, seed, *, pregenerate=False, executor=None):
         self.player = player
+        self.registry = registry
+        self.seed = seed
+        # If set, maps next to the current one are generated in the background
+        # ahead of time, so taking the stairs doesn't have to wait.  That
+        # happens in `executor` if given (which may be a process pool), or
+        # else in a thread of our own
+        self.pregenerate = pregenerate
+        self._executor = executor
+        self._owns_executor = executor is None
+        # Set by `close`, after which nothing more happens in the background
+        self.closed = False
+        # Map name => future for a compact canvas being generated in the
+        # background
+        self._pending = {}
 
         # TODO just thinking about how this would work, for now
         #self.zones = {}
@@ -31,12 +66,23 @@ class FloorPlan:
         # to that?
         # TODO maybe maps should just know their own names
         # TODO check that all maps are connected?
+        # Maps are only generated when something first asks for them, which
+        # keeps startup down to generating the first floor.  This is a name
+        # => `MapSpec` mapping.
+        self.map_specs = {}
+        self.map_specs['map0'] = MapSpec(
+            RuinFractor, Size(120, 30), down='map1')
+        self.map_specs['map1'] = MapSpec(
+            RuinedHallFractor, Size(120, 30), up='map0', down='map2')
+        self.map_specs['map2'] = MapSpec(
+            PerlinFractor, Size(150, 40), up='map1', down='map3')
+        self.map_specs['map3'] = MapSpec(
+            PerlinFractor, Size(60, 30), up='map2')
+        #self.map_specs['map3'] = MapSpec(BinaryPartitionFractor, Size(80, 24), minimum_size=Size(10, 8), up='map2')
+
         self.maps = {}
-        self.maps['map0'] = RuinFractor(Size(120, 30)).generate_map(down='map1')
-        self.maps['map1'] = RuinedHallFractor(Size(120, 30)).generate_map(up='map0', down='map2')
-        self.maps['map2'] = PerlinFractor(Size(150, 40)).generate_map(up='map1', down='map3')
-        self.maps['map3'] = PerlinFractor(Size(60, 30)).generate_map(up='map2')
-        #self.maps['map3'] = BinaryPartitionFractor(Size(80, 24), minimum_size=Size(10, 8)).generate_map(up='map2')
+        # Seconds spent generating each map, for the curious
+        self.generation_times = {}
         self.current_map_name = None
         self.current_map = None
 
@@ -44,10 +90,118 @@ class FloorPlan:
         # that doesn't seem right.
         self.starting_map = 'map0'
 
+    def get_map(self, name):
+        """Return the named map, generating it first if necessary."""
+        try:
+            return self.maps[name]
+        except KeyError:
+            pass
+
+        future = self._pending.pop(name, None)
+        if future is None:
+            canvas, seconds = self._generate_canvas(name)
+        else:
+            # Might have to wait for it to finish, but that's still no worse
+            # than starting from scratch
+            compact, seconds = future.result()
+            canvas = MapCanvas.from_compact(compact)
+
+        # Making the actual map hands out entity ids, which has to happen
+        # here, in the main thread, and always in the same order -- journals
+        # refer to entities by id
+        started = time.perf_counter()
+        map = canvas.to_map(self.registry)
+        self.generation_times[name] = seconds + time.perf_counter() - started
+        self.maps[name] = map
+        return map
+
+    def _generate_canvas(self, name):
+        started = time.perf_counter()
+        canvas = self.map_specs[name].generate_canvas(self.rng_for(name))
+        return canvas, time.perf_counter() - started
+
+    def generate_all(self, *, workers=None):
+        """Generate every map that doesn't exist yet, all at once, spread
+        across `workers` processes.  See `generate_many`.
+        """
+        names = [
+            name for name in self.map_specs
+            if name not in self.maps and name not in self._pending]
+        started = time.perf_counter()
+        maps = generate_many(
+            [self.map_specs[name] for name in names],
+            [self.seed_for(name) for name in names],
+            workers=workers, registry=self.registry)
+        # Can't tell how long each one took, so split it evenly
+        seconds = (time.perf_counter() - started) / max(len(names), 1)
+        for name, map in zip(names, maps):
+            self.maps[name] = map
+            self.generation_times[name] = seconds
+
+    def pregenerate_neighbors(self):
+        """Start generating, in the background, any maps the current one
+        connects to that don't exist yet.  Does nothing once the plan has
+        been closed.
+        """
+        from concurrent.futures import ThreadPoolExecutor
+
+        if self.closed:
+            return
+
+        for name in self.map_specs[self.current_map_name].connections:
+            if (name in self.maps or name in self._pending
+                    or name not in self.map_specs):
+                continue
+            if self._executor is None:
+                # One worker is plenty; it's only ever a floor or two ahead
+                self._executor = ThreadPoolExecutor(
+                    max_workers=1, thread_name_prefix='flax-mapgen')
+            self._pending[name] = self._executor.submit(
+                generate_compact, self.map_specs[name], self.seed_for(name))
+
+    def map_holding(self, entity):
+        """Return the generated map the entity is on, or None."""
+        # Most things happen on the current map, so try that first
+        current = self.current_map
+        if current is not None and entity.id in current.entity_positions:
+            return current
+        for map in self.maps.values():
+            if entity.id in map.entity_positions:
+                return map
+        return None
+
+    def pending_futures(self):
+        """Return the futures for every map still being generated in the
+        background.
+        """
+        return list(self._pending.values())
+
+    def close(self):
+        """Stop any background generation, for good.  A caller's executor is
+        left running, but isn't used again.
+        """
+        self.closed = True
+        for future in self._pending.values():
+            future.cancel()
+        self._pending.clear()
+        if self._executor is not None and self._owns_executor:
+            self._executor.shutdown(wait=False)
+        self._executor = None
+
+    def seed_for(self, name):
+        return '{}/{}'.format(self.seed, name)
+
+    def rng_for(self, name):
+        """Return a random number generator for the named map (or anything
+        else), seeded from the world seed.  Each map gets its own, so a map
+        comes out the same no matter when or in what order it's generated.
+        """
+        return random.Random(self.seed_for(name))
+
     def change_map(self, new_map_name):
         # Probably should call world.change_map() instead, which will clear out
         # some map-specific state.
-        new_map = self.maps[new_map_name]
+        new_map = self.get_map(new_map_name)
         player_position = None
 
         if self.current_map:
@@ -61,9 +215,8 @@ class FloorPlan:
             # This shouldn't normally happen, but for the moment, it always
             # does when starting the game.  TODO should fractor do this?  not
             # terribly efficient atm  :)
-            import random
             tiles = list(new_map.tiles.values())
-            random.shuffle(tiles)
+            self.rng_for(new_map_name + '/arrival').shuffle(tiles)
             while True:
                 tile = tiles.pop(0)
                 if not IPhysics(tile.architecture).blocks(self.player):
@@ -75,6 +228,9 @@ class FloorPlan:
         self.current_map.place(self.player, player_position)
         # TODO whoopsie, this doesn't actually update the map?
 
+        if self.pregenerate:
+            self.pregenerate_neighbors()
+
 
 class World:
     """The world.  Contains the core implementations of event handling and
@@ -83,29 +239,78 @@ class World:
     """
     obituary = None
 
-    def __init__(self):
+    def __init__(self, seed=None, *, pregenerate=False, executor=None):
+        # Everything random about the world follows from this, so the same
+        # seed and the same player actions always play out the same way
+        if seed is None:
+            seed = random.getrandbits(63)
+        self.seed = seed
+        # For anything random that happens during play, e.g. monster AI
+        self.rng = random.Random('{}/world'.format(seed))
+        # If set, a `flax.journal.JournalWriter` recording everything the
+        # player does
+        self.journal = None
+
+        # Every entity in the world gets an id from here
+        self.entities = EntityRegistry()
+
         # There can only be one player object.  We own it.
         self.player = Player()
+        self.entities.register(self.player)
 
         self.player_action_queue = deque()
         self.event_queue = deque()
-
-        self.floor_plan = FloorPlan(self.player)
+        # How many events have fired, all told
+        self.events_fired = 0
+        # The event currently being fired from the queue, if any
+        self.firing_event = None
+        # Event class name => how many were thrown away unfired, because
+        # someone involved died or left the map
+        self.dropped_events = Counter()
+        # If set, a combinable event queued while another of the same type and
+        # target is still waiting gets merged into that one instead, e.g.
+        # several hits on the same monster become a single Damage
+        self.coalesce_events = False
+        # (event type, target) => queued event, for coalescing
+        self._coalescible = {}
+
+        # Number of turns that have passed, and events scheduled for later ones
+        self.turn = 0
+        self.timers = TimingWheel(self.turn)
+        # When the player comes back to a map, at most this many of the turns
+        # they were away are simulated; see `catch_up`
+        self.catch_up_turns = 100
+        # Creatures (other than the player) heal a point of health every
+        # time the turn number hits a multiple of this; see `regenerate`
+        self.heal_interval = 10
+        # Who acts when, in ticks; only covers the current map
+        self.actors = ActorScheduler()
+        # How many times `advance` went well over its time budget
+        self.overruns = 0
+
+        self.floor_plan = FloorPlan(
+            self.player, self.entities, seed,
+            pregenerate=pregenerate, executor=executor)
         self.change_map(self.floor_plan.starting_map)
 
     @property
     def current_map(self):
         return self.floor_plan.current_map
 
+    def close(self):
+        """Stop any background map generation, and close the journal."""
+        self.floor_plan.close()
+        if self.journal is not None:
+            self.journal.close()
+
     def change_map(self, map_name):
         # TODO this is so stupidly special-casey, but i'm not really sure how
         # or when a Win should be fired.  i'd copy what Die does, but that's
         # kinda broken too, lol.  maybe the ladder should contain this
         # logic?
         if map_name == '__exit__':
-            # TODO starting to look like IContainer needs a .has()
             from flax.entity import Crown
-            if any(item.isa(Crown) for item in IContainer(self.player).inventory):
+            if IContainer(self.player).has(Crown):
                 raise GameOver(
                     "you found the Crown of Meeting Expectations and escaped "
                     "the dungeon!  good for you, seriously.",
@@ -116,10 +321,122 @@ class World:
 
         # TODO refund time?  or only eat it after the events succeed
         self.event_queue.clear()
+        self._coalescible.clear()
+
+        old_map = self.current_map
+        if old_map is not None:
+            old_map.left_turn = self.turn
+            old_map.on_place = None
 
         self.floor_plan.change_map(map_name)
 
+        new_map = self.current_map
+        if new_map.left_turn is not None:
+            self.catch_up(new_map, self.turn - new_map.left_turn)
+            new_map.left_turn = None
+        self._schedule_actors()
+        new_map.on_place = self._entity_placed
+
+    def catch_up(self, map, turns):
+        """Make up for a map having been left alone for `turns` turns.
+
+        Nothing on a map happens while the player is elsewhere, and actually
+        running all those turns would take forever, so this fakes it cheaply.
+        Creatures heal however much they would have, all at once; and actors
+        wander at random for a while, but only as far as
+        `catch_up_turns` allows.
+        """
+        from flax.geometry import Direction
+
+        if turns <= 0:
+            return
+
+        # Healing is just arithmetic, so it can cover any amount of time.
+        # Count the same turns live play would have healed on, so leaving
+        # and coming back doesn't change anything
+        interval = self.heal_interval
+        self.regenerate(
+            map, self.turn // interval - (self.turn - turns) // interval)
+
+        # Wandering is a step at a time, so it's capped
+        turns = min(turns, self.catch_up_turns)
+        directions = list(Direction)
+        for actor in list(map.query(IActor)):
+            if actor is self.player:
+                continue
+
+            steps = turns * IActor(actor).speed // NORMAL_SPEED
+            position = map.find(actor).position
+            for _ in range(steps):
+                new_position = position + self.rng.choice(directions)
+                if new_position not in map:
+                    continue
+                tile = map.tiles[new_position]
+                if tile.creature is not None or IPhysics(
+                        tile.architecture).blocks(actor):
+                    continue
+                map.move(actor, new_position)
+                position = new_position
+
+    def _schedule_actors(self):
+        # Only actors on the current map get to do anything.  The player keeps
+        # their place; everyone else has to wait a full action after the
+        # player arrives.  Anyone who turns up later gets scheduled by
+        # `_entity_placed`.
+        player_time = self.actors.when(self.player)
+        self.actors.clear()
+        now = self.actors.now
+        self.actors.schedule(
+            self.player, now if player_time is None else player_time)
+        for actor in self.query(IActor):
+            if actor is not self.player:
+                self.actors.schedule(actor, now + self.action_delay(actor))
+
+    def _entity_placed(self, entity):
+        # Something new on the current map (summoned, dropped, whatever); if
+        # it's an actor, it gets a go after a full action, like everyone else
+        # did when the player arrived
+        if (IActor in entity and entity is not self.player
+                and entity not in self.actors):
+            self.actors.schedule(
+                entity, self.actors.now + self.action_delay(entity))
+
+    def action_delay(self, actor):
+        """How many ticks the actor has to wait after acting."""
+        return action_delay(IActor(actor).speed)
+
+    def query(self, *requirements):
+        """Return a live iterable of every entity on the current map that
+        supports all of the given interfaces or component classes.  See
+        `Map.query`.
+        """
+        return self.current_map.query(*requirements)
+
+    def destroy_entity(self, entity):
+        """Remove an entity from the world entirely.
+
+        Takes it off whichever map it's on, if any; destroys every relation
+        it's part of, firing their ``on_destroy`` hooks; and finally releases
+        its id.
+        """
+        map = self.floor_plan.map_holding(entity)
+        if map is not None:
+            map.remove(entity)
+        self.actors.discard(entity)
+
+        relations = self.entities.relations
+        touching = relations.touching(entity)
+        for relation in touching:
+            if relation.on_destroy is not None:
+                DestroyRelationEvent(relation, forced=True).fire(self)
+        # Anything the hooks didn't take care of goes in one batch
+        relations.purge(entity)
+
+        self.entities.release(entity)
+
     def push_player_action(self, event):
+        if self.journal is not None:
+            self.journal.record_action(event)
         self.player_action_queue.append(event)
 
     def player_action_from_direction(self, direction):
@@ -150,44 +467,215 @@ class World:
 
         return Walk(self.player, direction)
 
-    def advance(self):
-        # Perform a turn for every actor on the map.  This is where stuff
-        # actually happens.
-
+    def regenerate(self, map, amount=1):
+        """Heal every creature on `map` (except the player) by `amount`, up
+        to their maximum health.  Happens once every `heal_interval` turns on
+        the current map; `catch_up` does several at once for other maps.
+        """
+        from flax.component import ICombatant
+        from flax.entity import Layer
+
+        if amount <= 0:
+            return
+        for entity, current, maximum in map.columns.iter_rows(
+                ICombatant['current_health'], ICombatant['maximum_health']):
+            if (current < maximum and entity is not self.player
+                    and entity.type.layer is Layer.creature):
+                ICombatant(entity).current_health = min(
+                    maximum, current + amount)
+
+    def advance(self, budget=None):
+        """Let everyone on the map act, in order of who's due next, until it's
+        the player's go and they haven't decided what to do yet.  Whenever
+        that crosses into a new turn, timers fire, and every `heal_interval`
+        turns creatures regenerate.  Returns True.
+
+        If the player already has several actions queued up, they all happen;
+        if they have none, nothing happens at all.
+
+        If `budget` is given, stops after that many seconds, even if there are
+        still actors waiting to go, and returns False; call again to carry on
+        from there.  At least one actor always gets to act, and an actor can't
+        be interrupted partway through, so a slice can still run long.  An
+        actor that takes longer than the whole budget by itself is logged and
+        counted in `overruns`.
+        """
+        actors = self.actors
+        started = time.perf_counter()
+        finished = True
         try:
-            # TODO this feels slightly laggier, i think, since the player's
-            # action now happens kind of /whenever/.  might help to have a
-            # persistent list of actors held by the map.  also to have a
-            # circular queue and just wait when we get to the player and
-            # there's nothing to do.
-            actors = []
-            for tile in self.current_map.tiles.values():
-                # TODO what if things other than creatures can think??  fuck
-                if tile.creature:
-                    actors.append(tile.creature)
-
-            # TODO should go in turn order
-            for actor in actors:
-                # TODO gross hack, that will hopefully just go away when this
-                # works better  :(  if an earlier run of this loop caused an
-                # actor to no longer be on the map, we shouldn't try to make it
-                # act
-                if actor not in self.current_map.entity_positions:
+            while True:
+                due, actor = actors.peek()
+                if actor is None:
+                    break
+
+                if due >= (self.turn + 1) * TICKS_PER_TURN:
+                    self.turn += 1
+                    if self.turn % self.heal_interval == 0:
+                        self.regenerate(self.current_map)
+                    self.fire_timers()
+                    # Timers might have changed who's next
                     continue
 
+                if actor is self.player and not self.player_action_queue:
+                    break
+
+                actors.pop()
+                # Dead actors linger in the schedule until they come up
+                if not self.is_present(actor):
+                    continue
+
+                # Reschedule first, so the action can change it (e.g. by
+                # moving the actor to another map)
+                actors.schedule(actor, due + self.action_delay(actor))
+                step_started = time.perf_counter()
                 IActor(actor).act(self)
                 self.drain_event_queue()
+
+                if budget is not None:
+                    now = time.perf_counter()
+                    if now - step_started > budget:
+                        self.overruns += 1
+                        log.debug(
+                            "%r took %.1f ms to act on turn %d, over the "
+                            "%.1f ms budget", actor,
+                            (now - step_started) * 1000, self.turn,
+                            budget * 1000)
+                    if now - started >= budget:
+                        finished = False
+                        break
         except GameOver as obit:
             self.obituary = obit
             raise
+        finally:
+            # Only record whole steps, so a replay can do them in one go
+            if finished and self.journal is not None:
+                self.journal.record_turn(self.turn, self.checksum())
+
+        return finished
+
+    def checksum(self):
+        """Return a CRC32 of the interesting parts of the world's state: which
+        map the player is on, the turn, and the position and health of every
+        creature on the map.  Used to check that replaying a journal plays
+        out the same way it did the first time.
+        """
+        from flax.component import ICombatant
+        from flax.entity import Layer
+        map = self.current_map
+        crc = zlib.crc32('{}/{}'.format(
+            self.floor_plan.current_map_name, self.turn).encode('utf8'))
+        positions = map.entity_positions
+        for entity, health in map.columns.iter_rows(
+                ICombatant['current_health']):
+            if entity.type.layer is not Layer.creature:
+                continue
+            position = positions[entity.id]
+            crc = zlib.crc32(
+                struct.pack('<Iiii', entity.id, position.x, position.y, health),
+                crc)
+        return crc
+
+    def schedule(self, delay, event):
+        """Fire `event` `delay` turns from now, at the end of that turn.
+        Returns a `Timer` that can be passed to `cancel`.
+        """
+        return self.timers.add(self.turn + delay, event)
+
+    def schedule_at(self, turn, event):
+        """Fire `event` at the end of the given turn."""
+        return self.timers.add(turn, event)
+
+    def schedule_recurring(self, interval, make_event, *, times=None, delay=None):
+        """Every `interval` turns, fire a fresh event made by calling
+        `make_event()`; `times` times, or until cancelled.  The first one
+        happens after `delay` turns, or `interval` if not given.
+
+        Stops on its own once it makes an event whose participants are gone.
+        """
+        if delay is None:
+            delay = interval
+        return self.timers.add(
+            self.turn + delay, make_event, interval=interval, times=times)
+
+    def cancel(self, timer):
+        self.timers.cancel(timer)
+
+    def fire_timers(self):
+        """Fire every scheduled event that's come due by the current turn."""
+        for timer in self.timers.advance(self.turn):
+            if timer.interval is None:
+                event = timer.payload
+            else:
+                event = timer.payload()
+                if event.is_stale():
+                    self.timers.cancel(timer)
+
+            self.queue_event(event)
+        self.drain_event_queue()
+
+    def is_present(self, entity):
+        """Whether the entity is on the current map."""
+        return entity.id in self.current_map.entity_positions
 
     def drain_event_queue(self):
-        while self.event_queue:
-            event = self.event_queue.popleft()
-            event.fire(self)
+        try:
+            while self.event_queue:
+                event = self.event_queue.popleft()
+                if event.combinable and self._coalescible:
+                    # Once it's out of the queue, it's too late to merge
+                    # anything else in
+                    key = type(event), event.target
+                    if self._coalescible.get(key) is event:
+                        del self._coalescible[key]
+
+                # Drop events from actors who have died or left the map
+                # since, or involving anything that's been destroyed
+                actor = event.actor
+                if event.is_stale() or (
+                        actor is not None and not self.is_present(actor)):
+                    self.dropped_events[type(event).__name__] += 1
+                    continue
+
+                self.firing_event = event
+                try:
+                    event.fire(self)
+                finally:
+                    self.firing_event = None
+        finally:
+            # Merging only happens within a single drain
+            self._coalescible.clear()
+
+    def _note_cascade(self, event):
+        if self.firing_event is not None:
+            event.cascade_depth = self.firing_event.cascade_depth + 1
+
+    def _coalesce(self, event):
+        """If coalescing, try to merge the event into an equivalent one that's
+        already queued.  Returns True if that worked, in which case the event
+        shouldn't be queued itself.
+
+        Note that the merged event fires wherever the first one was queued,
+        even if a later one was queued to happen immediately.
+        """
+        if not (self.coalesce_events and event.combinable):
+            return False
+
+        key = type(event), event.target
+        pending = self._coalescible.get(key)
+        if pending is None:
+            self._coalescible[key] = event
+            return False
+
+        pending.merge(event)
+        return True
 
     def queue_event(self, event):
-        self.event_queue.append(event)
+        self._note_cascade(event)
+        if not self._coalesce(event):
+            self.event_queue.append(event)
 
     def queue_immediate_event(self, event):
-        self.event_queue.appendleft(event)
+        self._note_cascade(event)
+        if not self._coalesce(event):
+            self.event_queue.appendleft(event)